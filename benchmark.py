@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+
+import gc
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import tracemalloc
+
+from game.headless import HeadlessGame, HeadlessMultiplayerGame, HeadlessChannel, HeadlessAuthor, HeadlessMessage
+from game.discord_funcs import MessageRouter, stutter_stats, PREFIXES
+from game.world import DEFAULT_WORLD
+from game.global_station import GlobalStation, get_global_station
+from game import profiles
+from game.zarya_discord import ZaryaGame, BATCH_SEPARATOR
+from game.sessions import deep_sizeof
+from game.stationgen import get_station, station_script
+
+
+__version__ = '0.1.0'
+
+
+# scripted playthroughs, sessions cycle through these
+PLAYTHROUGHS = {
+    'explore': [
+        'look around', 'go through front port', 'look', 'go through aft port', 'go through aft port',
+        'look around', 'go through front port', 'show inventory', 'help',
+    ],
+    'items': [
+        'search containers', 'take all', 'leave', 'take laptop', 'use drive', 'use laptop', 'read files',
+        'turn off', 'show inventory', 'drop paper', 'look around',
+    ],
+    'camera': [
+        'go through aft port', 'look around', 'use camera', 'use camera', 'use greenhouse', 'take camera',
+        'show inventory', 'use bed', 'info',
+    ],
+}
+# seconds between event loop lag samples
+LAG_INTERVAL = 0.01
+# inputs per round in the scripts made for generated stations
+STATION_SCRIPT_LENGTH = 12
+# numbers of live games the dispatch benchmark routes messages between
+DISPATCH_GAME_COUNTS = (1, 10, 100, 1000)
+# commands the parse benchmark times parse_command on, by how they should be matched
+PARSE_CORPUS = {
+    'exact': [
+        'look around', 'look', 'l', 'show inventory', 'i', 'help', 'take all', 'skip', 'quit', 'stats',
+    ],
+    'verb': [
+        'go through front port', 'gt aft', 'go nadir port', 'travel to zvezda', 'tt unity', 'take camera',
+        'pick up laptop', 'use laptop', 'drop rubbish picture', 'search containers', 'open aft port',
+        'my name is yuri',
+    ],
+    'invalid': [
+        'xyzzy', 'user laptop', 'gone through front port', 'look at the camera', 'taking camera', '',
+    ],
+}
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def measure_lag(lags, interval=LAG_INTERVAL):
+    """Record how late the event loop wakes up from each sleep, until cancelled."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def batched(script, batch: int) -> list:
+    """Join a script's inputs into batches of commands, sent as one input each."""
+    if batch <= 1:
+        return script
+    return [f'{BATCH_SEPARATOR} '.join(script[i:i + batch]) for i in range(0, len(script), batch)]
+
+
+def interleaved(scripts, first_author_id: int = 1) -> list:
+    """Take turns between several players' scripts, as a multiplayer script of (HeadlessAuthor, input) pairs."""
+    authors = [HeadlessAuthor(first_author_id + player) for player in range(len(scripts))]
+    return [
+        (author, line)
+        for lines in itertools.zip_longest(*scripts) for author, line in zip(authors, lines) if line is not None
+    ]
+
+
+async def run_benchmark(sessions: int, rounds: int, send_latency: float = 0, world=None, batch: int = 1,
+                        players: int = 1, global_station: GlobalStation = None) -> dict:
+    """Play scripts across some concurrent sessions, and get the results.
+
+    Sessions play the scripted playthroughs on the default world, or if world is a generated station's template,
+    each player wanders round it with their own script from station_script(). With batch over 1 the scripts' inputs
+    are sent that many commands at a time, and latencies are per batch. With players over 1 each session is a
+    multiplayer game, with its players taking turns to send their scripts' inputs. With a global_station every
+    session plays on it, all acting on the same rooms, and the results include its lock stats. If the profile store
+    has been started, players are saved to it as user i + 1 for session i, or in multiplayer sessions as their
+    HeadlessAuthor ids, which are different in every session since a user can only be played in one game at a time.
+    Session i is seeded with i, so every run plays the same games.
+    """
+    playthroughs = list(PLAYTHROUGHS.values())
+
+    def player_script(n):
+        if world is None:
+            return batched(playthroughs[n % len(playthroughs)] * rounds, batch)
+        return batched(station_script(world, STATION_SCRIPT_LENGTH * rounds, seed=n), batch)
+
+    world_name = DEFAULT_WORLD if world is None else world.name
+    games = []
+    for i in range(sessions):
+        channel = HeadlessChannel(latency=send_latency)
+        if players == 1:
+            games.append(HeadlessGame(
+                player_script(i), channel=channel, world=world_name, seed=i, global_station=global_station,
+                owner_id=i + 1
+            ))
+        else:
+            script = interleaved([player_script(i * players + player) for player in range(players)], i * players + 1)
+            games.append(HeadlessMultiplayerGame(
+                script, channel=channel, world=world_name, seed=i, global_station=global_station
+            ))
+
+    lags = []
+    lag_task = asyncio.ensure_future(measure_lag(lags))
+    if profiles.store is not None:
+        profiles_task = asyncio.ensure_future(profiles.store.run())
+    sends_saved = stutter_stats['sends_saved']
+    start = time.perf_counter()
+    await asyncio.gather(*(game.run() for game in games))
+    elapsed = time.perf_counter() - start
+    lag_task.cancel()
+    if profiles.store is not None:
+        profiles_task.cancel()
+        await profiles.store.flush()
+
+    latencies = [latency for game in games for latency in game.latencies]
+    results = {
+        'sessions': sessions,
+        'players_per_session': players,
+        'commands': len(latencies),
+        'seconds': elapsed,
+        'commands_per_second': len(latencies) / elapsed,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'loop_lag_p99_ms': percentile(lags, 99) * 1000,
+        'loop_lag_max_ms': max(lags, default=0) * 1000,
+        'messages_sent': sum(game.send_channel.sends for game in games),
+        'messages_edited': sum(game.send_channel.edits for game in games),
+        # stutters joined into another message instead of being sent on their own
+        'messages_saved': stutter_stats['sends_saved'] - sends_saved,
+    }
+    if global_station is not None:
+        results.update(global_station.stats())
+    if profiles.store is not None:
+        results.update(profiles.store.stats())
+    return results
+
+
+def measure_memory(sessions: int, pictures: int) -> dict:
+    """Measure the memory games keep, with players who've spammed the camera until they have lots of pictures.
+
+    Memory is counted twice: what tracemalloc has traced as still allocated once the games have finished, which
+    includes anything the games share, and an estimate from walking each game's world like the sessions stats do.
+    """
+    script = ['go through aft port'] + ['use camera'] * pictures
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    games = [HeadlessGame(script, seed=i) for i in range(sessions)]
+
+    async def play():
+        await asyncio.gather(*(game.run() for game in games))
+    asyncio.run(play())
+
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    inventories = [game.player.inventory for game in games]
+    items = sum(len(inventory) for inventory in inventories)
+    return {
+        'sessions': sessions,
+        'pictures_per_session': pictures,
+        'retained_bytes_per_session': retained // sessions,
+        'world_bytes_per_session': deep_sizeof(*(game.world_objects() for game in games)) // sessions,
+        'inventory_bytes_per_item': deep_sizeof(*inventories) // items,
+    }
+
+
+def measure_dispatch(messages: int, game_counts=DISPATCH_GAME_COUNTS) -> dict:
+    """Measure how long routing a message to its game takes, with more and more games running.
+
+    Every message is for one of the games, sent round them in turn, and as many again are sent to channels without
+    a game. The cost should stay flat however many games there are.
+    """
+    results = {'messages': messages}
+    for game_count in game_counts:
+        router = MessageRouter()
+        channels = [HeadlessChannel() for _ in range(game_count)]
+        for channel in channels:
+            router.register(channel.id)
+        to_games = [HeadlessMessage(channels[i % game_count], f'{PREFIXES[0]}look around') for i in range(messages)]
+        to_nobody = [HeadlessMessage(HeadlessChannel(), f'{PREFIXES[0]}look around') for _ in range(messages)]
+
+        start = time.perf_counter()
+        for message in to_games:
+            router.dispatch(message)
+        routed = time.perf_counter() - start
+        start = time.perf_counter()
+        for message in to_nobody:
+            router.dispatch(message)
+        dropped = time.perf_counter() - start
+
+        results[f'dispatch_us_{game_count}_games'] = routed / messages * 10 ** 6
+        results[f'dispatch_no_game_us_{game_count}_games'] = dropped / messages * 10 ** 6
+    return results
+
+
+def measure_parse(rounds: int, corpus=PARSE_CORPUS) -> dict:
+    """Measure how long parse_command takes to find a command's handler, for each kind of command in the corpus."""
+    results = {'parse_rounds': rounds}
+    every_command = []
+    for kind, commands in corpus.items():
+        every_command.extend(commands)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for command in commands:
+                ZaryaGame.parse_command(command)
+        results[f'parse_{kind}_ns'] = (time.perf_counter() - start) / (rounds * len(commands)) * 10 ** 9
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for command in every_command:
+            ZaryaGame.parse_command(command)
+    results['parse_ns'] = (time.perf_counter() - start) / (rounds * len(every_command)) * 10 ** 9
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Zarya games played headlessly from scripts.')
+    parser.add_argument('-n', '--sessions', type=int, default=100, help='number of concurrent sessions')
+    parser.add_argument('-r', '--rounds', type=int, default=3, help='times each session plays its script')
+    parser.add_argument('--send-latency-ms', type=float, default=0, help='simulated discord send and edit time')
+    parser.add_argument('--allocations', action='store_true', help='trace memory allocations, slows the run')
+    parser.add_argument('--max-p99-ms', type=float, help='exit with an error if p99 latency is over this')
+    parser.add_argument('--modules', type=int, help='play on a generated station with this many modules instead')
+    parser.add_argument('--items-per-module', type=int, default=10, help='average items per generated module')
+    parser.add_argument('-b', '--batch', type=int, default=1, help='commands sent in each input, separated by ;')
+    parser.add_argument('-p', '--players', type=int, default=1,
+                        help='players taking turns in each session, more than one plays multiplayer games')
+    parser.add_argument('--profiles', metavar='DB', help='save players to a profile store in this database file')
+    parser.add_argument('--global', dest='global_station', action='store_true',
+                        help='play every session on one global station, all acting on the same rooms')
+    parser.add_argument('--memory', type=int, metavar='PICTURES',
+                        help='measure memory per session instead, with this many pictures taken in each session')
+    parser.add_argument('--dispatch', type=int, metavar='MESSAGES',
+                        help=f'measure routing this many messages instead, to {DISPATCH_GAME_COUNTS} live games')
+    parser.add_argument('--parse', type=int, metavar='ROUNDS',
+                        help='measure parsing commands instead, going through a fixed corpus this many times')
+    args = parser.parse_args()
+
+    print(f'Zarya benchmark v{__version__}')
+    if args.parse is not None:
+        for key, value in measure_parse(args.parse).items():
+            print(f'{key}: {value:.1f}' if isinstance(value, float) else f'{key}: {value}')
+        return
+    if args.dispatch is not None:
+        for key, value in measure_dispatch(args.dispatch).items():
+            print(f'{key}: {value:.3f}' if isinstance(value, float) else f'{key}: {value}')
+        return
+    if args.memory is not None:
+        for key, value in measure_memory(args.sessions, args.memory).items():
+            print(f'{key}: {value}')
+        return
+
+    world = None
+    station_results = {}
+    if args.modules is not None:
+        start = time.perf_counter()
+        world = get_station(args.modules, args.items_per_module)
+        station_results = {
+            'world': world.name,
+            'world_rooms': len(world.rooms),
+            'world_items': len(world.items),
+            'world_ports': len(world.port_names),
+            'world_build_seconds': time.perf_counter() - start,
+        }
+    if args.profiles is not None:
+        profiles.start(args.profiles)
+    if args.allocations:
+        tracemalloc.start()
+    global_station = None
+    if args.global_station:
+        global_station = get_global_station(DEFAULT_WORLD if world is None else world.name)
+    results = asyncio.run(run_benchmark(
+        args.sessions, args.rounds, args.send_latency_ms / 1000, world, args.batch, args.players, global_station
+    ))
+    results.update(station_results)
+    if args.allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['allocated_peak_bytes'] = peak
+        results['allocated_per_session_bytes'] = peak // args.sessions
+    profiles.stop()
+
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f'{value:.3f}'
+        print(f'{key}: {value}')
+
+    if args.max_p99_ms is not None and results['latency_p99_ms'] > args.max_p99_ms:
+        print(f'p99 latency is over the limit of {args.max_p99_ms}ms.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
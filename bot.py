@@ -1,16 +1,32 @@
 #!/usr/bin/env python
 
+import io
 import os
 import sys
 import json
+import time
+import asyncio
+import argparse
 import subprocess
 
 from typing import Optional
 
 import discord
+import discord.http
 import discord.ext.commands
 
+import game.metrics as metrics
+import game.game_log as game_log
+import game.tracer as tracer
+import game.profiles as profiles
+import game.strings as strings
+import game.snapshots as snapshots
 import game.zarya_discord as zarya_discord
+from game.browser import laptop_browser
+from game.multiplayer import ZaryaMultiplayerGame
+from game.global_station import get_global_station
+from game.discord_funcs import message_router, input_from_message, discard_channel_output, DISCORD_MESSAGE_LEN_LIMIT
+from game.sessions import GameSessions, MAX_LIVE_SESSIONS, IDLE_TIMEOUT
 
 
 # todo: update readme
@@ -29,27 +45,150 @@ PREFIXES = (
     '>', '> ',
     '9v', '9v ',
 )
+STATS_DIR = 'stats'
+# seconds between writing stats when running as a shard
+STATS_INTERVAL = 30
 
-with open('settings.json', 'r') as settings_json:
+SETTINGS_FILE = 'settings.json'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the Zarya discord bot.')
+    parser.add_argument('--shard-id', type=int, help='shard to run, for running one of several bot processes')
+    parser.add_argument('--shard-count', type=int, help='total number of shards')
+    parser.add_argument('--settings', default=SETTINGS_FILE, help='settings file to use')
+    args = parser.parse_args()
+    if (args.shard_id is None) != (args.shard_count is None):
+        parser.error('--shard-id and --shard-count must be used together')
+    return args
+
+
+# the shard has to be known before the client is made, discord.py only reads it in the client's constructor
+args = parse_args()
+with open(args.settings, 'r') as settings_json:
     settings = json.load(settings_json)
+# another discord API to connect to instead of discord's, like the fake one shards.py --check runs
+if settings['discord'].get('api_base'):
+    discord.http.Route.BASE = settings['discord']['api_base']
 
 
 def game_instance_running_check(ctx):
     return ctx.channel.id not in ctx.bot.game_instances
 
 
+class ZaryaBot(discord.ext.commands.bot.Bot):
+    async def close(self):
+        await laptop_browser.close()
+        await metrics.stop()
+        await super().close()
+
+
 help_command = discord.ext.commands.DefaultHelpCommand(no_category="Commands (prefixes - '>', '9v')")
 help_command.add_check(game_instance_running_check)
-client = discord.ext.commands.bot.Bot(command_prefix=PREFIXES, help_command=help_command)
+client = ZaryaBot(
+    command_prefix=PREFIXES, help_command=help_command, shard_id=args.shard_id, shard_count=args.shard_count
+)
+
+session_settings = settings.get('sessions', {})
+client.game_instances = GameSessions(
+    max_live=session_settings.get('max_live', MAX_LIVE_SESSIONS),
+    idle_timeout=session_settings.get('idle_timeout', IDLE_TIMEOUT),
+    keep_snapshots=session_settings.get('keep_snapshots', True),
+)
+# world every game plays on together as one global station, or None for every channel to have its own station
+client.global_world = session_settings.get('global_station')
+client.reaper_task = None
+client.stats_task = None
+client.profiles_task = None
+metrics_settings = settings.get('metrics', {})
+
+
+# first words of every game command, which go to the game even if there's a bot command with the same name, like help
+GAME_COMMAND_WORDS = frozenset(
+    [command.split()[0] for command in ZaryaMultiplayerGame.exact_commands] + list(ZaryaMultiplayerGame.verb_commands)
+)
+
 
-client.game_instances = {}
+def is_bot_command(content: str) -> bool:
+    """Check if some input is a bot command, like play or sessions, rather than input for a game."""
+    first_word = content.split()[0]
+    return first_word not in GAME_COMMAND_WORDS and client.get_command(first_word) is not None
+
+
+# the bot's own commands are done by the bot, the message that starts a game mustn't be its first input as well
+message_router.ignore = is_bot_command
+
+
+def bot_stats(with_memory: bool = True) -> dict:
+    """Get the stats of the live games, and of the global station and profile store if they're used."""
+    stats = client.game_instances.stats(with_memory=with_memory)
+    if client.global_world is not None:
+        stats.update(get_global_station(client.global_world).stats())
+    if profiles.store is not None:
+        stats.update(profiles.store.stats())
+    return stats
+
+
+# the memory estimate is too slow to work out every time the metrics are read
+metrics.gauges.append(lambda: bot_stats(with_memory=False))
+
+
+def shard_stats_path(shard_id) -> str:
+    return os.path.join(STATS_DIR, f'shard-{shard_id}.json')
+
+
+def write_shard_stats(stats):
+    os.makedirs(STATS_DIR, exist_ok=True)
+    path = shard_stats_path(stats['shard_id'])
+    with open(path + '.tmp', 'w') as stats_file:
+        json.dump(stats, stats_file)
+    os.replace(path + '.tmp', path)
+
+
+async def report_shard_stats(interval=STATS_INTERVAL):
+    """Write this shard's stats to a file for the shard supervisor forever, run this as a background task."""
+    while True:
+        stats = client.game_instances.stats(with_memory=False)
+        stats.update(
+            shard_id=client.shard_id, guilds=len(client.guilds), latency=client.latency, updated=time.time()
+        )
+        await client.loop.run_in_executor(None, write_shard_stats, stats)
+        await asyncio.sleep(interval)
 
 
 @client.event
 async def on_ready():
+    # on_ready can fire again after a reconnect
+    if client.reaper_task is None:
+        client.reaper_task = client.loop.create_task(client.game_instances.reap())
+    if client.shard_id is not None and client.stats_task is None:
+        client.stats_task = client.loop.create_task(report_shard_stats())
+    if profiles.store is not None and client.profiles_task is None:
+        client.profiles_task = client.loop.create_task(
+            profiles.store.run(settings.get('profiles', {}).get('flush_interval', profiles.FLUSH_INTERVAL))
+        )
+    if metrics_settings.get('enabled', False):
+        # each shard serves its metrics on the next port along
+        port = metrics_settings.get('port', metrics.METRICS_PORT) + (client.shard_id or 0)
+        await metrics.start(
+            host=metrics_settings.get('host', metrics.METRICS_HOST), port=port,
+            lag_interval=metrics_settings.get('lag_interval', metrics.LAG_INTERVAL),
+        )
     print('Bot running.')
 
 
+@client.listen('on_message')
+async def route_game_input(message):
+    # resume a saved game when someone carries on playing in its channel, unless they're using a bot command
+    if (client.global_world is None and message.channel.id not in client.game_instances
+            and snapshots.has_snapshot(message.channel.id)):
+        content = input_from_message(message, '')
+        if content and client.get_command(content.split()[0]) is None:
+            client.loop.create_task(run_game(new_game(message.channel, owner_id=message.author.id)))
+    if message_router.dispatch(message):
+        client.game_instances.touch(message.channel.id)
+
+
 @client.command(hidden=True, aliases=['update'])
 @discord.ext.commands.is_owner()
 async def pull(ctx, branch: Optional[str]):
@@ -62,10 +201,37 @@ async def pull(ctx, branch: Optional[str]):
 @discord.ext.commands.is_owner()
 async def restart(ctx):
     await ctx.send('Restarting bot.')
+    game_log.stop()
+    profiles.stop()
     # https://blog.petrzemek.net/2014/03/23/restarting-a-python-script-within-itself/
     os.execv(sys.executable, ['python'] + sys.argv)
 
 
+@client.command(hidden=True)
+@discord.ext.commands.is_owner()
+async def sessions(ctx):
+    stats = bot_stats()
+    await ctx.send('\n'.join(f'{key}: {value}' for key, value in stats.items()))
+
+
+@client.command(hidden=True, name='profile', aliases=['trace'])
+@discord.ext.commands.is_owner()
+async def profile_commands(ctx, action: Optional[str], top: Optional[int]):
+    """Trace how long commands take: 'on [top]' starts, 'off' stops, anything else shows the slowest so far."""
+    if action == 'on':
+        tracer.start(top or tracer.TOP_N)
+        await ctx.send(f'Tracing the slowest {tracer.top_n} commands.')
+        return
+    if action == 'off':
+        tracer.stop()
+
+    report = f'```\n{tracer.report()}\n```'
+    if len(report) <= DISCORD_MESSAGE_LEN_LIMIT:
+        await ctx.send(report)
+    else:
+        await ctx.send(file=discord.File(io.BytesIO(tracer.report().encode()), 'profile.txt'))
+
+
 @client.command(aliases=['inv', 'add'], description='Get the bot add link')
 async def invite(ctx):
     await ctx.send(f'<BOT_ADD_LINK>')
@@ -82,32 +248,122 @@ async def credit(ctx):
     await ctx.send(f'Hosting and translations (pending) with help from Dukt {DUKT_INVITE}')
 
 
+@client.command(aliases=['lang'], description='Set the language games in this server are played in')
+@discord.ext.commands.guild_only()
+@discord.ext.commands.has_permissions(manage_guild=True)
+async def language(ctx, lang: Optional[str]):
+    if not lang:
+        await ctx.send(f"Language: {strings.guild_lang(ctx.guild.id)} \n"
+                       f"Available: {', '.join(strings.available_langs())}")
+        return
+
+    try:
+        strings.set_guild_lang(ctx.guild.id, lang)
+    except ValueError:
+        await ctx.send(f"There's no {lang} translation. Available: {', '.join(strings.available_langs())}")
+    else:
+        await ctx.send(f'New games in this server will be played in {lang}.')
+
+
 @client.command(aliases=['log', 'log.txt'])
 async def logs(ctx):
     try:
-        file = discord.File(os.path.join('game', 'log.txt'))
+        file = discord.File(game_log.log_path())
     except FileNotFoundError:
         await ctx.send('No logs.')
     else:
         await ctx.send(file=file)
 
 
+def new_game(channel, multiplayer=False, owner_id=None):
+    """Create a game for a channel and start routing its input, restoring its snapshot if it has one.
+
+    A channel with a snapshot carries on with the kind of game it was, single or multiplayer, whatever's asked for.
+    Games on the global station are never saved, what their players had is left on the station when they end.
+    owner_id is the user a single player game's player is, whose profile it's kept in. A restored game keeps the
+    owner it was saved with instead, whoever carries it on.
+    """
+    guild = getattr(channel, 'guild', None)
+    lang = strings.guild_lang(guild.id if guild is not None else None)
+    state = None
+    global_station = None
+    if client.global_world is not None:
+        global_station = get_global_station(client.global_world)
+    elif snapshots.has_snapshot(channel.id):
+        state = snapshots.load(channel.id)
+    if state is not None:
+        multiplayer = 'players' in state
+    game_class = ZaryaMultiplayerGame if multiplayer else zarya_discord.ZaryaGame
+    game_instance = game_class(
+        client, channel, channel.name, lang=lang, persistent=global_station is None, global_station=global_station,
+        owner_id=None if multiplayer else owner_id,
+    )
+    if state is not None:
+        try:
+            game_instance.restore(state)
+        except (KeyError, ValueError, TypeError) as error:
+            # a snapshot from an older world or strings file, which can't be played on, so start again
+            print(f"Couldn't restore the snapshot for channel {channel.id}: {error!r}")
+            message_router.unregister(channel.id, game_instance.input_queue)
+            snapshots.delete(channel.id)
+            return new_game(channel, multiplayer, owner_id)
+    client.game_instances[channel.id] = game_instance
+    return game_instance
+
+
+async def run_game(game_instance):
+    game_instance.log_start()
+    try:
+        await game_instance.run()
+    finally:
+        client.game_instances.remove(game_instance)
+        message_router.unregister(game_instance.send_channel.id, game_instance.input_queue)
+        # a game started in the channel since this one was evicted keeps sending to it
+        if game_instance.send_channel.id not in client.game_instances:
+            discard_channel_output(game_instance.send_channel.id)
+
+
 # todo: fix the error every time an ingame command is used that isn't a bot command
 @client.command()
 async def play(ctx):
     if ctx.channel.id in client.game_instances:
         return
 
-    game_instance = zarya_discord.ZaryaGame(client, ctx.channel, ctx.channel.name)
-    client.game_instances[ctx.channel.id] = game_instance
+    await run_game(new_game(ctx.channel, owner_id=ctx.author.id))
 
-    game_instance.log_start()
-    # todo: catch errors better (might fail to close the instance if it errors)
-    await game_instance.run()
 
-    client.game_instances.pop(ctx.channel.id)
+@client.command(aliases=['mp', 'coop'], description='Play a game everyone in the channel can join')
+async def multiplayer(ctx):
+    if ctx.channel.id in client.game_instances:
+        return
+
+    await run_game(new_game(ctx.channel, multiplayer=True))
 
 
 if __name__ == '__main__':
     print('Bot starting..')
-    client.run(settings['discord']['token'])
+    log_settings = settings.get('logging', {})
+    log_path = log_settings.get('file', game_log.LOG_FILE)
+    if args.shard_id is not None:
+        print(f'Running shard {args.shard_id} of {args.shard_count}.')
+        # each shard process gets its own log file, rotation isn't safe with several writers
+        log_root, log_ext = os.path.splitext(log_path)
+        log_path = f'{log_root}.shard{args.shard_id}{log_ext}'
+
+    snapshots.scan()
+    profile_settings = settings.get('profiles', {})
+    if profile_settings.get('enabled', True):
+        profiles.start(
+            path=profile_settings.get('file', profiles.DB_FILE),
+            flush_size=profile_settings.get('flush_size', profiles.FLUSH_SIZE),
+        )
+    game_log.start(
+        path=log_path,
+        max_bytes=log_settings.get('max_bytes', game_log.LOG_MAX_BYTES),
+        backup_count=log_settings.get('backup_count', game_log.LOG_BACKUP_COUNT),
+    )
+    try:
+        client.run(settings['discord']['token'])
+    finally:
+        game_log.stop()
+        profiles.stop()
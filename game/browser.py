@@ -0,0 +1,119 @@
+import time
+import collections
+
+import aiohttp
+
+
+MAX_CONNECTIONS = 20
+MAX_CONNECTIONS_PER_HOST = 4
+# seconds
+TIMEOUT = 10
+# pages are cut off after this many bytes, anything longer would just be a wall of messages anyway
+MAX_RESPONSE_BYTES = 8 * 1024
+READ_CHUNK_BYTES = 1024
+# seconds to keep fetched pages for
+CACHE_TTL = 300
+CACHE_SIZE = 64
+TRUNCATED_SUFFIX = '\n...'
+
+
+class LaptopBrowser:
+    """Shared web client for the in-game laptop's browser.
+
+    Every game uses the same pooled aiohttp session, which is created on first use. Responses are read in chunks
+    and cut off at a maximum size, and recently fetched pages are cached for a short time.
+
+    Attrs:
+        max_connections -- connections open at once over all hosts
+        max_connections_per_host
+        timeout -- seconds a whole request may take
+        max_response_bytes -- size responses are truncated to
+        cache_ttl -- seconds a fetched page is cached for
+        cache_size -- how many pages to cache
+    """
+    def __init__(
+            self, max_connections: int = MAX_CONNECTIONS, max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+            timeout: float = TIMEOUT, max_response_bytes: int = MAX_RESPONSE_BYTES,
+            cache_ttl: float = CACHE_TTL, cache_size: int = CACHE_SIZE
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_response_bytes = max_response_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self.session = None
+        # url to (expiry time, page text), oldest first
+        self.cache = collections.OrderedDict()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it if needed. Must be called while the event loop is running."""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.max_connections_per_host
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.session
+
+    def get_cached(self, url: str):
+        """Get a cached page, or None if it isn't cached or has expired."""
+        cached = self.cache.get(url)
+        if cached is None:
+            return None
+        expiry, text = cached
+        if expiry < time.monotonic():
+            del self.cache[url]
+            return None
+        return text
+
+    def add_cached(self, url: str, text: str):
+        self.cache[url] = (time.monotonic() + self.cache_ttl, text)
+        self.cache.move_to_end(url)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def fetch(self, url: str) -> str:
+        """Get the text of a web page, truncated to max_response_bytes.
+
+        Raises:
+            ValueError -- the url is invalid
+            aiohttp.ClientError -- the request failed
+            asyncio.TimeoutError -- the request took longer than the timeout
+        """
+        text = self.get_cached(url)
+        if text is not None:
+            return text
+
+        body = bytearray()
+        truncated = False
+        async with self.get_session().get(url) as response:
+            async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+                body += chunk
+                if len(body) >= self.max_response_bytes:
+                    # stop reading, the rest of the response is dropped with the connection
+                    truncated = len(body) > self.max_response_bytes or not response.content.at_eof()
+                    del body[self.max_response_bytes:]
+                    break
+            charset = response.charset or 'utf-8'
+
+        try:
+            text = body.decode(charset, errors='replace')
+        except LookupError:
+            text = body.decode('utf-8', errors='replace')
+        if truncated:
+            text += TRUNCATED_SUFFIX
+
+        self.add_cached(url, text)
+        return text
+
+    async def close(self):
+        """Close the shared session, call this when the bot shuts down."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+laptop_browser = LaptopBrowser()
@@ -1,5 +1,10 @@
 import time
 import random
+import asyncio
+
+from typing import NamedTuple
+
+from .. import tracer
 
 
 # TODO: improved framework, compatibility with builtin print and input, more features, etc.
@@ -12,10 +17,104 @@ PREFIXES = (
     '9v', '9v ',
 )
 
+# discord lets a channel edit messages about this many times per this many seconds before rate limiting it
+EDIT_RATE_LIMIT = 5
+EDIT_RATE_PER = 5
+
+# counters for the output pipeline, summed over all channels
+stutter_stats = {
+    'sends': 0,
+    'edits': 0,
+    # edits left out because of the rate limit budget
+    'edits_saved': 0,
+    # messages left out by joining stutters that were waiting on the same channel, or held back for one command
+    'sends_saved': 0,
+    # stutters sent all at once because the channel had no edits left
+    'degraded': 0,
+}
+
+
+class EditBudget:
+    """Token bucket of how many message edits a channel can make without hitting discord's rate limit.
+
+    Attrs:
+        rate -- how many edits can be made per period
+        per -- length of the period in seconds
+        tokens -- edits that can be made right now
+    """
+    def __init__(self, rate: int = EDIT_RATE_LIMIT, per: float = EDIT_RATE_PER):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def available(self) -> int:
+        """Refill the bucket for the time passed since the last check, and get how many whole edits are left."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        return int(self.tokens)
+
+    def spend(self):
+        self.tokens -= 1
+
+
+class ChannelOutput:
+    """Output state for one channel.
+
+    Attrs:
+        lock -- serialises output to the channel, so concurrent stutters keep their order
+        pending -- stutters waiting for the lock, as lists of [text, delay, skip]
+        budget -- EditBudget for the channel
+        held -- whether stutters are being held back in pending, to be sent together when the channel is released
+    """
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = []
+        self.budget = EditBudget()
+        self.held = False
+
+
+# one per channel id, so output to one channel never waits on another
+channel_outputs = {}
+
+
+def channel_output(channel) -> ChannelOutput:
+    """Get the output state for a discord channel, creating it if needed."""
+    output = channel_outputs.get(channel.id)
+    if output is None:
+        output = channel_outputs[channel.id] = ChannelOutput()
+    return output
+
+
+def discard_channel_output(channel_id):
+    """Forget a channel's output state once its game has ended, unless something is still being sent to it."""
+    output = channel_outputs.get(channel_id)
+    if output is not None and not output.lock.locked() and not output.pending and not output.held:
+        del channel_outputs[channel_id]
+
+
+def hold_output(channel):
+    """Hold back the stutters to a channel until it's released, so they're sent joined as one message."""
+    channel_output(channel).held = True
+
+
+async def send_held_output(channel, release: bool = True):
+    """Send the stutters held back for a channel, and stop holding them unless release is False."""
+    output = channel_output(channel)
+    if release:
+        output.held = False
+    if output.pending:
+        await _send_pending(output, channel)
+
 
 async def discord_stutter(text, channel, delay=lambda: random.randint(1, 3)/100, skip=False):
     """Send a message to a discord channel, with gradual print effect.
 
+    Stutters that pile up waiting for the same channel, or that are held back with hold_output(), are joined and
+    sent as one message, and the gradual effect uses fewer edits, or none, when the channel is running out of edits
+    before discord's rate limit.
+
     Args:
         text -- the message to send
         channel -- discord channel object to send it to
@@ -25,15 +124,40 @@ async def discord_stutter(text, channel, delay=lambda: random.randint(1, 3)/100,
     if not text:
         return
 
+    output = channel_output(channel)
+    output.pending.append([text, delay, skip])
+    if not output.held:
+        await _send_pending(output, channel)
+
+
+async def _send_pending(output: ChannelOutput, channel):
+    """Send a channel's pending stutters as one message, once any stutter already being sent is done."""
+    started = tracer.await_started()
+    async with output.lock:
+        # an earlier stutter that got the lock first already sent this one along with its own
+        if output.pending:
+            batch = output.pending
+            output.pending = []
+
+            stutter_stats['sends_saved'] += len(batch) - 1
+            text = '\n'.join(entry[0] for entry in batch)
+            skip = all(entry[2] for entry in batch)
+            await _stutter(text, channel, batch[0][1], skip, output.budget)
+    tracer.await_ended(started, tracer.DISCORD)
+
+
+async def _stutter(text, channel, delay, skip, budget):
+    """Send a message with the gradual print effect, the caller should hold the channel lock."""
     # recurse to send the message in parts if it's over the message length limits
     if len(text) > DISCORD_MESSAGE_LEN_LIMIT:
         part_len = DISCORD_MESSAGE_LEN_LIMIT
         parts = [text[i:i + part_len] for i in range(0, len(text), part_len)]
         for part in parts:
-            await discord_stutter(part, channel, delay, skip)
+            await _stutter(part, channel, delay, skip, budget)
         return
 
     if skip:
+        stutter_stats['sends'] += 1
         await channel.send(text)
     else:
         if len(text) > 500:
@@ -42,10 +166,26 @@ async def discord_stutter(text, channel, delay=lambda: random.randint(1, 3)/100,
             part_len = 100
         parts = [text[i:i+part_len] for i in range(0, len(text), part_len)]
 
+        # merge parts so the effect doesn't need more edits than the channel has left
+        edits_wanted = len(parts) - 1
+        edits_available = budget.available()
+        if edits_wanted > edits_available:
+            stutter_stats['edits_saved'] += edits_wanted - edits_available
+            if edits_available == 0:
+                stutter_stats['degraded'] += 1
+                parts = [text]
+            else:
+                part_len = -(-len(text) // (edits_available + 1))
+                parts = [text[i:i+part_len] for i in range(0, len(text), part_len)]
+
+        stutter_stats['sends'] += 1
         message = await channel.send(parts[0])
         for i in range(2, len(parts)+1):
+            budget.spend()
+            stutter_stats['edits'] += 1
             await message.edit(content=''.join(parts[:i]))
-            time.sleep(delay())
+            # yield to the event loop instead of blocking it, so other channels' games keep running
+            await asyncio.sleep(delay())
 
 
 def input_from_message(message, req_channel_name, prefixes=None):
@@ -70,19 +210,64 @@ def input_from_message(message, req_channel_name, prefixes=None):
     return ''
 
 
-async def discord_input(discord_client, req_channel_name, prefixes=None):
-    """Wait for a discord message with valid input, then return it.
+class GameInput(NamedTuple):
+    """Input from a message, with who sent it so multiplayer games can tell players apart."""
+    content: str
+    author_id: int
+    author_name: str
 
-    Like the builtin input() function but for discord
-    Args:
-        client -- discord client object
-        channel -- discord channel to pay attention to messages in
+
+class MessageRouter:
+    """Route prefixed messages to the input queues of running games, keyed by channel id.
+
+    Dispatching a message is a single dict lookup, however many games are running, unlike every game waiting on
+    discord_client.wait_for('message') and checking every message itself.
+
+    Attrs:
         prefixes -- list of command prefixes
-    Returns:
-        String content from a valid message, with the prefix removed.
+        queues -- dict of channel id to the asyncio.Queue of GameInputs for the game in that channel
+        ignore -- function that takes a message's input and returns True if it isn't for games, like bot commands,
+            or None to give games everything
     """
-    while True:
-        new_message = await discord_client.wait_for('message')
-        check = input_from_message(new_message, req_channel_name, prefixes)
-        if check:
-            return check
+    def __init__(self, prefixes=None, ignore=None):
+        if not prefixes:
+            prefixes = PREFIXES
+        self.prefixes = prefixes
+        self.queues = {}
+        self.ignore = ignore
+
+    def register(self, channel_id):
+        """Get the input queue for a channel, creating it if the channel doesn't have one yet."""
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = asyncio.Queue()
+        return queue
+
+    def unregister(self, channel_id, queue=None):
+        """Stop routing messages for a channel.
+
+        Args:
+            channel_id
+            queue -- if given, only unregister the channel if this is still its queue
+        """
+        if queue is None or self.queues.get(channel_id) is queue:
+            self.queues.pop(channel_id, None)
+
+    def dispatch(self, message):
+        """Put the input from a message in its channel's queue, if that channel has a game.
+
+        Returns:
+            True if the message was routed to a game, otherwise False.
+        """
+        queue = self.queues.get(message.channel.id)
+        if queue is None:
+            return False
+
+        content = input_from_message(message, '', self.prefixes)
+        if not content or (self.ignore is not None and self.ignore(content)):
+            return False
+        queue.put_nowait(GameInput(content, message.author.id, message.author.display_name))
+        return True
+
+
+message_router = MessageRouter()
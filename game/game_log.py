@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import uuid
+import queue
+import logging
+import threading
+import logging.handlers
+
+from typing import NamedTuple, List
+
+
+LOG_FILE = 'log.txt'
+LOG_MAX_BYTES = 1024 ** 2
+LOG_BACKUP_COUNT = 5
+LOG_FORMAT = '%(asctime)s [%(channel)s:%(session)s] %(message)s'
+# most records to write before flushing the file
+BATCH_SIZE = 512
+# marks a player's input in the log, everything else is the game's notes
+INPUT_PREFIX = '> '
+START_MESSAGE = 'hello world! new game in #'
+# marks a stored profile a player was loaded from, as the user's id and a json list of the profile's values
+PROFILE_PREFIX = 'profile '
+# a record as formatted by LOG_FORMAT, lines that don't match are continuations of multi-line records
+LOG_LINE = re.compile(r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \[([^\]:]*):(\w+)\] (.*)$')
+
+logger = logging.getLogger('zarya.game')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# sentinel that tells the writer thread to stop
+_STOP = object()
+log_writer = None
+
+
+class LogWriter(threading.Thread):
+    """Background thread that writes queued log records to a size-rotated file in batches.
+
+    Logging from a coroutine only puts the record on a queue, so the event loop never waits on disk I/O.
+
+    Attrs:
+        records -- queue of log records waiting to be written
+        handler -- RotatingFileHandler used for formatting and rotation
+    """
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        super().__init__(name='zarya-log-writer', daemon=True)
+        self.records = queue.SimpleQueue()
+        self.handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        self.handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = False
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                    continue
+                if self.handler.shouldRollover(record):
+                    self.handler.doRollover()
+                self.handler.stream.write(self.handler.format(record) + self.handler.terminator)
+            self.handler.flush()
+
+            if stopping:
+                self.handler.close()
+                return
+
+
+def start(path: str = LOG_FILE, max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT):
+    """Start writing game logs to a file from a background thread."""
+    global log_writer
+    if log_writer is not None:
+        return
+
+    log_writer = LogWriter(path, max_bytes, backup_count)
+    log_writer.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_writer.records))
+
+
+def stop():
+    """Flush any logs still queued and stop the writer thread. Call this before the bot shuts down or restarts."""
+    global log_writer
+    if log_writer is None:
+        return
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    log_writer.records.put(_STOP)
+    log_writer.join()
+    log_writer = None
+
+
+def log_path():
+    """Get the path of the file logs are being written to, or the default if logging hasn't started."""
+    if log_writer is None:
+        return LOG_FILE
+    return log_writer.handler.baseFilename
+
+
+def session_logger(channel_id) -> logging.LoggerAdapter:
+    """Get a logger that tags its records with a channel and a new session id."""
+    return logging.LoggerAdapter(logger, {'channel': channel_id, 'session': uuid.uuid4().hex[:8]})
+
+
+def start_message(channel_name: str, **details) -> str:
+    """Get the message a session's log starts with, with details like its seed as key=value pairs."""
+    return START_MESSAGE + channel_name + ''.join(f' {key}={value}' for key, value in details.items())
+
+
+class SessionLog(NamedTuple):
+    channel: str
+    # key=value details from the session's start message, as strings
+    details: dict
+    # every input the session got, in order
+    inputs: List[str]
+    # user id to the json decoded values of the stored profile their player was loaded from
+    profiles: dict
+
+
+def log_files(path: str = LOG_FILE) -> list:
+    """Get the paths of a log file and the backups it has been rotated to, oldest first."""
+    backups = []
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        backups.append(f'{path}.{index}')
+        index += 1
+    return backups[::-1] + [path]
+
+
+def read_session(session_id: str, path: str = LOG_FILE) -> SessionLog:
+    """Read one session's start details, inputs and stored profiles back from a log file and its backups.
+
+    Raises:
+        LookupError -- the session isn't in the logs, or its start has been rotated out of them
+    """
+    channel = None
+    details = None
+    inputs = []
+    stored_profiles = {}
+    # whether the last record was one of the session's inputs, so the lines continuing it are added to it
+    last_was_input = False
+    for file_path in log_files(path):
+        with open(file_path, encoding='utf-8') as log_file:
+            for line in log_file:
+                line = line.rstrip('\n')
+                match = LOG_LINE.match(line)
+                if match is None:
+                    if last_was_input:
+                        inputs[-1] += '\n' + line
+                    continue
+
+                last_was_input = False
+                if match.group(2) != session_id:
+                    continue
+                message = match.group(3)
+                if message.startswith(START_MESSAGE):
+                    channel = match.group(1)
+                    details = dict(re.findall(r' (\w+)=(\S*)', message[len(START_MESSAGE):]))
+                elif message.startswith(INPUT_PREFIX):
+                    inputs.append(message[len(INPUT_PREFIX):])
+                    last_was_input = True
+                elif message.startswith(PROFILE_PREFIX):
+                    user_id, _, values = message[len(PROFILE_PREFIX):].partition(' ')
+                    stored_profiles[int(user_id)] = json.loads(values)
+
+    if details is None:
+        raise LookupError(f'no start of session {session_id} in the logs')
+    return SessionLog(channel, details, inputs, stored_profiles)
@@ -0,0 +1,112 @@
+import time
+import asyncio
+import contextlib
+
+from typing import Callable
+
+from .strings import get_catalog, DEFAULT_LANG
+from .world import get_world, WorldTemplate, DEFAULT_WORLD
+from .zarya_discord import ZaryaGame, ZaryaStation, StationBuilder, Picture, USE_HANDLERS
+
+
+# most pictures left lying in one place, the oldest are cleared away past this
+MAX_LOOSE_PICTURES = 20
+
+
+class GlobalStation:
+    """A station that every game on it plays in together, whatever channel or server the game is in.
+
+    The rooms and items are shared, so what's dropped in a room from one server can be picked up from another,
+    while each game keeps its own players. Rooms are built in the default language, since games in every language
+    share them.
+
+    Most commands don't need locking: every game runs on the one event loop, and a command on the global station
+    has its output buffered and sent once it's done, so it never yields to another game part way through changing
+    the world. Commands that wait for input or send as they go, like use, do yield part way through, so they're
+    done holding their room's or container's lock, which other games' unbuffered commands there wait for.
+
+    The world's items are unique and only move around, but pictures are made by every game, so the oldest ones
+    left lying about are cleared away to keep places from filling up with them.
+
+    Attrs:
+        station -- the shared ZaryaStation
+        builder -- StationBuilder the rooms are built with
+        pictures_cleared -- how many loose pictures have been cleared away
+        locks -- dict of place to its asyncio.Lock, made the first time an unbuffered command is done there
+        acquires -- how many times a lock has been taken
+        contended -- how many of those had to wait for another game
+        wait_seconds -- total time games have waited for locks
+        max_wait_seconds -- longest a game has waited for a lock
+    """
+    def __init__(self, world: WorldTemplate):
+        self.builder = StationBuilder(get_catalog(DEFAULT_LANG), ZaryaGame.item_classes)
+        self.station = ZaryaStation(world, self.builder.build_room)
+        self.pictures_cleared = 0
+        self.locks = {}
+        self.acquires = 0
+        self.contended = 0
+        self.wait_seconds = 0
+        self.max_wait_seconds = 0
+
+    @contextlib.asynccontextmanager
+    async def locked(self, place, waiting: Callable = None):
+        """Hold a room's or container's lock, waiting for any other game doing an unbuffered command there first.
+
+        Args:
+            place -- the room or container
+            waiting -- coroutine function called first if another game has the lock, to tell the player they're waiting
+        """
+        lock = self.locks.get(place)
+        if lock is None:
+            lock = self.locks[place] = asyncio.Lock()
+        self.acquires += 1
+        if lock.locked():
+            self.contended += 1
+            start = time.perf_counter()
+            if waiting is not None:
+                await waiting()
+            await lock.acquire()
+            wait = time.perf_counter() - start
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        else:
+            await lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def tidy(self, place):
+        """Clear away the oldest pictures lying in a room or container, if there are more than MAX_LOOSE_PICTURES."""
+        pictures = place.items.of_type(Picture)
+        for picture in pictures[:len(pictures) - MAX_LOOSE_PICTURES]:
+            place.items.remove(picture)
+            self.pictures_cleared += 1
+
+    def stats(self) -> dict:
+        return {
+            'global_world': self.station.world.name,
+            'global_rooms_built': len(self.station.rooms),
+            'global_pictures_cleared': self.pictures_cleared,
+            'lock_acquires': self.acquires,
+            'lock_contended': self.contended,
+            'lock_wait_total_ms': self.wait_seconds * 1000,
+            'lock_wait_max_ms': self.max_wait_seconds * 1000,
+        }
+
+
+# one global station per world, started the first time a game joins it
+_stations = {}
+
+
+def get_global_station(world: str = DEFAULT_WORLD) -> GlobalStation:
+    """Get the global station for a world, starting it if no game has joined it yet.
+
+    Raises:
+        FileNotFoundError -- there's no world with that name
+        WorldError -- the world file isn't valid
+    """
+    station = _stations.get(world)
+    if station is None:
+        station = _stations[world] = GlobalStation(get_world(world, USE_HANDLERS, get_catalog(DEFAULT_LANG)))
+    return station
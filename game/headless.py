@@ -0,0 +1,156 @@
+import time
+import asyncio
+import itertools
+
+from .discord_funcs import message_router, discard_channel_output, PREFIXES
+from .zarya_discord import ZaryaGame
+from .multiplayer import ZaryaMultiplayerGame
+from .world import DEFAULT_WORLD
+
+
+# fake channel ids start high so they can't be mistaken for small test numbers
+_channel_ids = itertools.count(10 ** 17)
+
+
+class HeadlessAuthor:
+    """Stand-in for the discord user who sent a message."""
+    def __init__(self, author_id: int, display_name: str = None):
+        self.id = author_id
+        self.display_name = f'player{author_id}' if display_name is None else display_name
+
+
+# who sends scripts' inputs unless they say otherwise
+DEFAULT_AUTHOR = HeadlessAuthor(1, 'headless')
+
+
+class HeadlessMessage:
+    """Stand-in for a discord message."""
+    def __init__(self, channel, content: str, author: HeadlessAuthor = DEFAULT_AUTHOR):
+        self.channel = channel
+        self.content = content
+        self.author = author
+
+    async def edit(self, content: str):
+        await asyncio.sleep(self.channel.latency)
+        self.content = content
+        self.channel.edits += 1
+
+
+class HeadlessChannel:
+    """Stand-in for a discord text channel, which keeps count of what's sent to it.
+
+    Attrs:
+        id
+        name
+        keep_output -- whether to keep the messages sent to the channel
+        latency -- seconds sending or editing a message takes, sends always yield to the event loop like real ones
+        messages -- the HeadlessMessages sent, if keep_output
+        sends -- how many messages have been sent
+        edits -- how many messages have been edited
+    """
+    def __init__(self, channel_id: int = None, name: str = 'headless', keep_output: bool = False,
+                 latency: float = 0):
+        if channel_id is None:
+            channel_id = next(_channel_ids)
+        self.id = channel_id
+        self.name = name
+        self.keep_output = keep_output
+        self.latency = latency
+        self.messages = []
+        self.sends = 0
+        self.edits = 0
+
+    async def send(self, content: str):
+        await asyncio.sleep(self.latency)
+        self.sends += 1
+        message = HeadlessMessage(self, content)
+        if self.keep_output:
+            self.messages.append(message)
+        return message
+
+    def output(self) -> str:
+        """Get the text of every message kept, one per line."""
+        return '\n'.join(message.content for message in self.messages)
+
+
+class HeadlessClient:
+    """Stand-in for the discord client, which sends input to games the way a player's messages would."""
+    def __init__(self, prefix: str = PREFIXES[0]):
+        self.prefix = prefix
+
+    def send_input(self, channel, text: str, author: HeadlessAuthor = DEFAULT_AUTHOR) -> bool:
+        return message_router.dispatch(HeadlessMessage(channel, f'{self.prefix}{text}', author))
+
+
+class HeadlessGame(ZaryaGame):
+    """A game that plays itself from a script of inputs, with no typing effect.
+
+    Each input is sent through the message router when the game asks for input, and the time from sending an input
+    to the game asking for the next one is recorded as that command's latency, or the batch's if the input has
+    several commands. The game quits when the script runs out.
+
+    Attrs:
+        script -- iterator of the inputs left, each a string or an (author, string) pair to send it from a
+            HeadlessAuthor other than DEFAULT_AUTHOR
+        latencies -- seconds each input took to handle
+        stored_players -- dict of user id to the StoredPlayer their player is loaded from instead of the profile
+            store, like the ones a replayed session was logged with, or None to use the store
+    """
+    def __init__(self, script, discord_client: HeadlessClient = None, channel: HeadlessChannel = None,
+                 browser=None, persistent=False, world=DEFAULT_WORLD, seed: int = None, lang: str = None,
+                 global_station=None, owner_id: int = None, stored_players: dict = None):
+        if discord_client is None:
+            discord_client = HeadlessClient()
+        if channel is None:
+            channel = HeadlessChannel()
+        super().__init__(
+            discord_client, channel, channel.name, browser=browser, persistent=persistent, lang=lang, world=world,
+            seed=seed, global_station=global_station, owner_id=owner_id
+        )
+        self.script = iter(script)
+        self.latencies = []
+        self.stored_players = stored_players
+        self._sent_at = None
+
+    def stored_player(self, user_id: int):
+        if self.stored_players is None:
+            return super().stored_player(user_id)
+        return self.stored_players.get(user_id)
+
+    async def stutter(self, text, delay=None, skip=False):
+        await self.send_output(text, skip=True)
+
+    async def read_input(self):
+        now = time.perf_counter()
+        if self._sent_at is not None:
+            self.latencies.append(now - self._sent_at)
+        line = next(self.script, 'quit')
+        if isinstance(line, str):
+            self.discord_client.send_input(self.send_channel, line)
+        else:
+            self.discord_client.send_input(self.send_channel, line[1], line[0])
+        self._sent_at = time.perf_counter()
+        return await super().read_input()
+
+    async def run(self):
+        try:
+            await super().run()
+        finally:
+            message_router.unregister(self.send_channel.id, self.input_queue)
+            discard_channel_output(self.send_channel.id)
+
+
+class HeadlessMultiplayerGame(HeadlessGame, ZaryaMultiplayerGame):
+    """A multiplayer game that plays itself from a script of (HeadlessAuthor, input) pairs.
+
+    The game only ends once every player has quit, so each player that hasn't quit by the end of the script quits
+    then, and every player keeps being sent quit after that in case one was taken as the answer to a prompt.
+    """
+    def __init__(self, script, *args, **kwargs):
+        script = list(script)
+        last_inputs = {author: text for author, text in script}
+        quits = [(author, 'quit') for author, text in last_inputs.items() if text != 'quit']
+        super().__init__(
+            itertools.chain(script, quits, itertools.cycle([(author, 'quit') for author in last_inputs])),
+            *args, **kwargs
+        )
@@ -0,0 +1,170 @@
+import time
+import bisect
+import asyncio
+import logging
+
+from aiohttp import web
+
+from .discord_funcs import stutter_stats
+
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+# seconds between event loop lag samples
+LAG_INTERVAL = 0.5
+# upper bounds in seconds of histogram buckets, there's one more bucket for anything longer
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# prefix of command handlers' names, left out of the verb label
+COMMAND_PREFIX = 'command_'
+
+
+class Histogram:
+    """Counts of values in buckets by upper bound, plus their total, like a Prometheus histogram.
+
+    Attrs:
+        bounds -- upper bounds of the buckets, smallest first
+        counts -- how many values went in each bucket, with one more at the end for values over every bound
+        sum -- total of every value
+    """
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: tuple = SECONDS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def samples(self, name: str, labels: str = '') -> list:
+        """Get the histogram as lines of the Prometheus text format, with labels like 'verb="look",'."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        labels = f'{{{labels.rstrip(",")}}}' if labels else ''
+        lines.append(f'{name}_sum{labels} {self.sum}')
+        lines.append(f'{name}_count{labels} {cumulative}')
+        return lines
+
+
+class RateLimitCounter(logging.Handler):
+    """Counts the rate limits discord.py hits, from the warnings it logs when it waits one out.
+
+    discord.py retries rate limited requests itself, so its warning is all there is to see of them. The seconds it
+    waits are the warning's first argument.
+    """
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.waits = 0
+        self.wait_seconds = 0
+
+    def emit(self, record: logging.LogRecord):
+        if 'rate limit' not in str(record.msg):
+            return
+        self.waits += 1
+        if record.args and isinstance(record.args[0], (int, float)):
+            self.wait_seconds += record.args[0]
+
+
+# process_command latency by the name of the command's handler, also counting the commands
+command_seconds = {}
+# how late the event loop wakes up from a sleep
+loop_lag_seconds = Histogram()
+rate_limits = RateLimitCounter()
+# functions that get dicts of gauge names to numbers, called every time the metrics are read
+gauges = []
+runner = None
+lag_task = None
+
+
+def observe_command(handler_name: str, seconds: float):
+    """Record a command done by a handler, and how long process_command took to do it."""
+    histogram = command_seconds.get(handler_name)
+    if histogram is None:
+        histogram = command_seconds[handler_name] = Histogram()
+    histogram.observe(seconds)
+
+
+async def measure_loop_lag(interval: float = LAG_INTERVAL):
+    """Record how late the event loop wakes up from each sleep, forever. Run this as a background task."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(time.perf_counter() - start - interval)
+
+
+def render() -> str:
+    """Get every metric in the Prometheus text format."""
+    lines = ['# TYPE zarya_commands_total counter']
+    verbs = {name: name[len(COMMAND_PREFIX):] if name.startswith(COMMAND_PREFIX) else name for name in command_seconds}
+    for name, histogram in command_seconds.items():
+        lines.append(f'zarya_commands_total{{verb="{verbs[name]}"}} {histogram.count()}')
+    lines.append('# TYPE zarya_command_seconds histogram')
+    for name, histogram in command_seconds.items():
+        lines.extend(histogram.samples('zarya_command_seconds', f'verb="{verbs[name]}",'))
+
+    lines.append('# TYPE zarya_loop_lag_seconds histogram')
+    lines.extend(loop_lag_seconds.samples('zarya_loop_lag_seconds'))
+
+    for key, value in stutter_stats.items():
+        lines.append(f'# TYPE zarya_stutter_{key}_total counter')
+        lines.append(f'zarya_stutter_{key}_total {value}')
+    lines.append('# TYPE zarya_rate_limits_total counter')
+    lines.append(f'zarya_rate_limits_total {rate_limits.waits}')
+    lines.append('# TYPE zarya_rate_limit_wait_seconds_total counter')
+    lines.append(f'zarya_rate_limit_wait_seconds_total {rate_limits.wait_seconds}')
+
+    for gauge in gauges:
+        for key, value in gauge().items():
+            # stats can have names and the like in them, only numbers are metrics
+            if isinstance(value, (int, float)):
+                lines.append(f'# TYPE zarya_{key} gauge')
+                lines.append(f'zarya_{key} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render())
+
+
+async def start(host: str = METRICS_HOST, port: int = METRICS_PORT, lag_interval: float = LAG_INTERVAL):
+    """Serve the metrics at http://host:port/metrics, and start measuring the event loop's lag.
+
+    Raises:
+        OSError -- the port can't be listened on
+    """
+    global runner, lag_task
+    if runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        runner = None
+        raise
+    lag_task = asyncio.ensure_future(measure_loop_lag(lag_interval))
+    logging.getLogger('discord.http').addHandler(rate_limits)
+
+
+async def stop():
+    """Stop serving the metrics, the counts are kept."""
+    global runner, lag_task
+    if runner is None:
+        return
+
+    logging.getLogger('discord.http').removeHandler(rate_limits)
+    lag_task.cancel()
+    lag_task = None
+    await runner.cleanup()
+    runner = None
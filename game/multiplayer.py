@@ -0,0 +1,251 @@
+import asyncio
+import collections
+
+from . import game_log
+from .discord_funcs import discord_stutter, GameInput
+from .zarya_discord import ZaryaGame, compile_exact_commands, split_batch, BATCH_SEPARATOR
+
+
+# seconds a player at a prompt has to answer before they're taken back out of it, so everyone else can carry on
+PROMPT_TIMEOUT = 120
+
+
+class PromptTimedOut(Exception):
+    """Raised from a multiplayer game's input() when the player at a prompt takes too long to answer it."""
+
+
+class ZaryaMultiplayerGame(ZaryaGame):
+    """A game everyone in a channel plays together, each as their own player on the same station.
+
+    Anyone who sends a command joins, starting in the world's start room with nothing. Players share the station,
+    so what one drops another can take, but each has their own room, inventory and sleepiness.
+
+    Commands are done one at a time by the game's one task, in the order they were sent, so players never race
+    each other for the world and nothing needs locking. While a player is at a prompt, like the laptop's, input
+    from everyone else waits until they're done, and they're told it's waiting. A player who doesn't answer a prompt
+    within the prompt timeout is taken out of it, so nobody can hold the game up for long. All the output from a
+    player's command, or their whole batch, is sent as one message headed with their name, instead of a message
+    per line.
+
+    Attrs:
+        players -- dict of discord user id to ZaryaPlayer, in the order they joined
+        player_id -- id of the player whose command is being done, None before anyone has joined
+        deferred_input -- GameInputs from other players that came in while someone was at a prompt
+        prompt_timeout -- seconds a player has to answer a prompt
+    """
+    def __init__(self, *args, prompt_timeout: float = PROMPT_TIMEOUT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deferred_input = collections.deque()
+        self.prompt_timeout = prompt_timeout
+        # output is always buffered, and sent when a player's turn ends or they're asked for more input
+        self.output_buffer = []
+
+    def create_world(self):
+        super().create_world()
+        # players are made as they join
+        self.players = {}
+        self.player = None
+        self.player_id = None
+
+    async def next_input(self, prompt: bool = False, timeout: float = None) -> GameInput:
+        """Get the next input to do, sending the buffered output first if it has to wait for the channel.
+
+        The rest of a batch comes first, then input that was deferred while someone was at a prompt, unless this is
+        for a prompt, then input from the channel. Inputs are only split into batches when they're not for a prompt,
+        so a prompt gets the whole line.
+
+        Raises:
+            asyncio.TimeoutError -- there was no input from the channel within the timeout, if there is one
+        """
+        if self.pending_input:
+            return self.pending_input.popleft()
+        if self.deferred_input and not prompt:
+            game_input = self.deferred_input.popleft()
+        else:
+            await self.flush_output()
+            game_input = await asyncio.wait_for(self.read_input(), timeout)
+            self.log(f'{game_log.INPUT_PREFIX}{game_input.author_id} {game_input.content}')
+        if prompt:
+            return game_input
+        return self.split_input(game_input)
+
+    def split_input(self, game_input: GameInput) -> GameInput:
+        """Start a batch if an input has several commands, giving the first and leaving the rest pending."""
+        if BATCH_SEPARATOR not in game_input.content:
+            return game_input
+
+        commands = split_batch(game_input.content)
+        self.pending_input.extend(game_input._replace(content=command) for command in commands[1:])
+        return game_input._replace(content=commands[0])
+
+    async def input(self, batch: bool = False):
+        """Get the next input from the player whose command is being done, for a prompt like the laptop's.
+
+        With batch, for the main loop of a game played inside this one, like the laptop's text game, the player's
+        input is split into a batch like the main loop's. Without it the prompt gets the whole line.
+
+        Raises:
+            PromptTimedOut -- the player didn't answer within the prompt timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.prompt_timeout
+        told = set()
+        while True:
+            try:
+                game_input = await self.next_input(prompt=True, timeout=max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise PromptTimedOut() from None
+            if game_input.author_id == self.player_id:
+                if batch:
+                    game_input = self.split_input(game_input)
+                return game_input.content
+            self.deferred_input.append(game_input)
+            # once per prompt is enough for each player who's waiting
+            if game_input.author_id not in told:
+                told.add(game_input.author_id)
+                await self.stutter(self.text(
+                    'multiplayer.waiting', name=game_input.author_name, player=self.player.name
+                ))
+
+    async def flush_output(self):
+        """Send the output buffered since the last flush as one message, headed with whose command it was."""
+        if not self.output_buffer:
+            return
+        if self.player is not None:
+            self.output_buffer.insert(0, self.text('multiplayer.header', name=self.player.name))
+        text = '\n'.join(self.output_buffer)
+        self.output_buffer = []
+        await discord_stutter(text, channel=self.send_channel, skip=True)
+
+    async def join(self, game_input: GameInput) -> bool:
+        """Make the sender of an input the player whose command is being done, adding them if they're new.
+
+        Returns:
+            False if they can't join because they're playing in another game.
+        """
+        player = self.players.get(game_input.author_id)
+        if player is None:
+            player = self.new_player(game_input.author_name)
+            if not self.join_profile(player, game_input.author_id):
+                self.player = self.player_id = None
+                await self.stutter(self.text('multiplayer.already_playing', name=game_input.author_name))
+                return False
+            self.players[game_input.author_id] = player
+            self.player_id = game_input.author_id
+            self.player = player
+            await self.stutter(self.text('multiplayer.joined', name=self.player.name, room=self.current_room.name))
+        else:
+            self.player_id = game_input.author_id
+            self.player = player
+        return True
+
+    async def main_loop(self):
+        while self.carry['on']:
+            game_input = await self.next_input()
+            if not await self.join(game_input):
+                # the rest of their batch too
+                self.pending_input.clear()
+                continue
+            await self.pass_time()
+            try:
+                await self.process_command(game_input.content.lower())
+            except PromptTimedOut:
+                self.log(f'prompt timed out for {self.player_id}')
+                await self.stutter(self.text('multiplayer.prompt_timeout', name=self.player.name))
+            if self.player_id in self.players:
+                self.player.profile.commands += 1
+            else:
+                # they've quit, so they've been saved for the last time and the rest of their batch is dropped
+                self.pending_input.clear()
+            # a player's turn ends with their batch, and its output goes before the next player's
+            if not self.pending_input:
+                if self.player_id in self.players:
+                    self.save_profile(self.player)
+                await self.flush_output()
+                await self.save_snapshot()
+
+    def log_start(self):
+        self.log(game_log.start_message(
+            self.req_channel_name, seed=self.seed, lang=self.strings.lang, world=self.world.name,
+            resumed=int(self.resumed), multiplayer=1
+        ))
+
+    def item_spaces(self) -> dict:
+        """Get every item space in the world, keyed like places() with 'inventory/<user id>' for each inventory."""
+        item_spaces = {key: place.items for key, place in self.places().items()}
+        for player_id, player in self.players.items():
+            item_spaces[f'inventory/{player_id}'] = player.inventory
+        return item_spaces
+
+    def world_objects(self) -> list:
+        return [self.places(), self.players, self.station.items]
+
+    def players_snapshot(self, place_keys: dict) -> dict:
+        return {
+            'players': {
+                player_id: self.player_snapshot(player, place_keys) for player_id, player in self.players.items()
+            },
+        }
+
+    def restore(self, state: dict):
+        # the players have to be there for their inventories to be restored, their ids are strings in the snapshot
+        self.players = {
+            int(player_id): self.new_player(player_state['player_name'])
+            for player_id, player_state in state['players'].items()
+        }
+        super().restore(state)
+        # players being played in another game by now still play on here, without their profile being saved
+        for player_id, player in self.players.items():
+            self.join_profile(player, player_id)
+
+    def restore_players(self, state: dict, places: dict):
+        for player_id, player_state in state['players'].items():
+            self.restore_player(self.players[int(player_id)], player_state, places)
+
+    def others_in(self, room) -> list:
+        """Get the players in a room apart from the one whose command is being done."""
+        return [player for player in self.players.values() if player.current_room is room and player is not self.player]
+
+    async def command_look(self, argument):
+        await super().command_look(argument)
+        others = self.others_in(self.current_room)
+        if others:
+            await self.stutter(self.text('multiplayer.here', players=', '.join(player.name for player in others)))
+
+    async def command_who(self, argument):
+        await self.stutter(self.text('multiplayer.who', players=' \n'.join(
+            self.text('multiplayer.who_entry', name=player.name, room=player.current_room.name)
+            for player in self.players.values()
+        )))
+
+    def leave_station(self):
+        for player in self.players.values():
+            self.drop_inventory(player)
+
+    def leave_profiles(self):
+        for player in self.players.values():
+            self.leave_profile(player)
+
+    async def command_quit(self, argument):
+        # what the player had stays on the station for everyone else
+        self.drop_inventory(self.player)
+        self.leave_profile(self.player)
+        del self.players[self.player_id]
+        await self.stutter(self.text('multiplayer.left', name=self.player.name, room=self.current_room.name))
+        if not self.players:
+            self.carry['on'] = False
+
+    async def command_help(self, argument):
+        await self.stutterf(self.text('commands.help.info'))
+        await self.stutterf(self.text('multiplayer.help'))
+        await self.stutter(self.text('commands.help.uninitiated'))
+
+    exact_commands = {
+        **ZaryaGame.exact_commands,
+        **compile_exact_commands({
+            ('help', 'h', 'commands'): command_help,
+            ('quit', 'q'): command_quit,
+            ('look around', 'look', 'la', 'l'): command_look,
+            ('who', 'players', 'crew'): command_who,
+        }),
+    }
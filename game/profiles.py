@@ -0,0 +1,239 @@
+import sqlite3
+import asyncio
+import logging
+import concurrent.futures
+
+from typing import NamedTuple, Optional, Tuple
+
+
+DB_FILE = 'zarya.db'
+# seconds between writing the profiles saved since the last write
+FLUSH_INTERVAL = 5
+# players waiting to be written that make the writer go before the interval is up
+FLUSH_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    wearing TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    commands INTEGER NOT NULL,
+    pictures_taken INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS pictures (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    quality INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pictures_by_player ON pictures (guild_id, user_id);
+'''
+# sqlite3 keeps these compiled in each connection's statement cache, so they're only prepared once
+SELECT_PLAYER = (
+    'SELECT name, wearing, sessions, commands, pictures_taken, likes FROM players WHERE guild_id = ? AND user_id = ?'
+)
+SELECT_PICTURES = 'SELECT quality FROM pictures WHERE guild_id = ? AND user_id = ? ORDER BY id'
+REPLACE_PLAYER = 'INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+DELETE_PICTURES = 'DELETE FROM pictures WHERE guild_id = ? AND user_id = ?'
+INSERT_PICTURE = 'INSERT INTO pictures (guild_id, user_id, quality) VALUES (?, ?, ?)'
+
+logger = logging.getLogger('zarya.profiles')
+
+
+class Profile:
+    """A player's record that's kept from game to game.
+
+    Attrs:
+        guild_id -- guild the player plays in, 0 for DMs
+        user_id -- the player's discord user id, or None for players nobody in particular plays, which aren't kept
+        sessions -- how many games they've played
+        commands -- how many commands they've done
+        pictures_taken
+        likes -- likes their pictures have got
+    """
+    __slots__ = ('guild_id', 'user_id', 'sessions', 'commands', 'pictures_taken', 'likes')
+
+    def __init__(self, guild_id: int = 0, user_id: int = None, sessions: int = 0, commands: int = 0,
+                 pictures_taken: int = 0, likes: int = 0):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.sessions = sessions
+        self.commands = commands
+        self.pictures_taken = pictures_taken
+        self.likes = likes
+
+
+class StoredPlayer(NamedTuple):
+    """A player as they're kept in the store, plain values copied from their Profile and the player."""
+    guild_id: int
+    user_id: int
+    name: str
+    wearing: str
+    sessions: int
+    commands: int
+    pictures_taken: int
+    likes: int
+    # qualities of the pictures they have
+    pictures: Tuple[int, ...]
+
+    def profile(self) -> Profile:
+        return Profile(self.guild_id, self.user_id, self.sessions, self.commands, self.pictures_taken, self.likes)
+
+
+class ProfileStore:
+    """Players' profiles and picture collections in an SQLite database, written behind the games.
+
+    Loading a player is a lookup on the (guild, user) index. Saving one only keeps their latest state in memory,
+    and a background task writes every player saved since it last ran in one transaction, from a worker thread, so
+    games never wait on the disk. The database is in WAL mode, so loading doesn't wait for writes either.
+
+    A player is saved whole, so they can only be played in one game at a time, or the games would save over each
+    other's counts. Games claim a player before loading them and release them once they're saved for the last time.
+    Each guild is only ever on one shard, so the claims don't need sharing between processes.
+
+    Attrs:
+        path -- the database file
+        pending -- dict of (guild id, user id) to the StoredPlayer waiting to be written
+        writing -- the same for the players being written right now
+        live -- set of (guild id, user id) of the players claimed by a game
+        flushes -- how many times players have been written
+        writes -- how many players have been written
+        write_errors -- how many flushes failed and were put back to try again
+    """
+    def __init__(self, path: str = DB_FILE, flush_size: int = FLUSH_SIZE):
+        self.path = path
+        self.flush_size = flush_size
+        self.reader = self.connect()
+        self.reader.executescript(SCHEMA)
+        self.pending = {}
+        self.writing = {}
+        self.live = set()
+        self.flushes = 0
+        self.writes = 0
+        self.write_errors = 0
+        # one thread does every write, with its own connection made the first time
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='zarya-profiles')
+        self.writer = None
+        self.wake = None
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # in WAL mode this is still safe from corruption, and a commit doesn't wait for the disk
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def load(self, guild_id: int, user_id: int) -> Optional[StoredPlayer]:
+        """Get a player as they were last saved, or None if they've never been saved."""
+        key = (guild_id, user_id)
+        stored = self.pending.get(key) or self.writing.get(key)
+        if stored is not None:
+            return stored
+        row = self.reader.execute(SELECT_PLAYER, key).fetchone()
+        if row is None:
+            return None
+        pictures = tuple(quality for quality, in self.reader.execute(SELECT_PICTURES, key))
+        return StoredPlayer(guild_id, user_id, *row, pictures)
+
+    def claim(self, guild_id: int, user_id: int) -> bool:
+        """Claim a player for a game, or get False if another game is playing them."""
+        key = (guild_id, user_id)
+        if key in self.live:
+            return False
+        self.live.add(key)
+        return True
+
+    def release(self, guild_id: int, user_id: int):
+        self.live.discard((guild_id, user_id))
+
+    def save(self, stored: StoredPlayer):
+        """Keep a player's state to be written by the next flush, replacing any state of theirs still waiting."""
+        self.pending[stored.guild_id, stored.user_id] = stored
+        if len(self.pending) >= self.flush_size and self.wake is not None:
+            self.wake.set()
+
+    def write(self, batch: list):
+        """Write some players in one transaction, in the worker thread."""
+        if self.writer is None:
+            self.writer = self.connect()
+        with self.writer:
+            self.writer.executemany(REPLACE_PLAYER, [stored[:-1] for stored in batch])
+            self.writer.executemany(DELETE_PICTURES, [(stored.guild_id, stored.user_id) for stored in batch])
+            self.writer.executemany(INSERT_PICTURE, [
+                (stored.guild_id, stored.user_id, quality) for stored in batch for quality in stored.pictures
+            ])
+
+    async def flush(self):
+        """Write every player saved since the last flush, from the worker thread."""
+        if not self.pending or self.writing:
+            return
+        self.writing = self.pending
+        self.pending = {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.write, list(self.writing.values()))
+        except sqlite3.Error as error:
+            # like the database being locked by another shard, the batch is tried again with the next one, under
+            # anything saved for the same players since
+            self.write_errors += 1
+            logger.warning("Couldn't write %d profiles, trying again next flush: %r", len(self.writing), error)
+            self.pending = {**self.writing, **self.pending}
+        else:
+            self.flushes += 1
+            self.writes += len(self.writing)
+        finally:
+            self.writing = {}
+
+    async def run(self, interval: float = FLUSH_INTERVAL):
+        """Flush every interval, or sooner if lots of players are waiting, forever. Run this as a background task."""
+        self.wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+
+    def close(self):
+        """Write everything still waiting and close the database, once the event loop has stopped."""
+        batch = list(self.writing.values()) + list(self.pending.values())
+        self.pending = {}
+        if batch:
+            self.executor.submit(self.write, batch).result()
+        if self.writer is not None:
+            self.executor.submit(self.writer.close).result()
+        self.executor.shutdown()
+        self.reader.close()
+
+    def stats(self) -> dict:
+        return {
+            'profiles_pending': len(self.pending),
+            'profile_flushes': self.flushes,
+            'profile_writes': self.writes,
+            'profile_write_errors': self.write_errors,
+            'profiles_live': len(self.live),
+        }
+
+
+# the store games save their players in, None if profiles aren't being kept
+store = None
+
+
+def start(path: str = DB_FILE, flush_size: int = FLUSH_SIZE) -> ProfileStore:
+    """Open the profile store for games to load and save players in. Run its run() as a background task."""
+    global store
+    if store is None:
+        store = ProfileStore(path, flush_size)
+    return store
+
+
+def stop():
+    """Write the players still waiting and close the store. Call this before the bot shuts down or restarts."""
+    global store
+    if store is not None:
+        store.close()
+        store = None
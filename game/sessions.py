@@ -0,0 +1,138 @@
+import gc
+import sys
+import time
+import types
+import asyncio
+import collections
+
+
+MAX_LIVE_SESSIONS = 500
+# seconds without input before a game is evicted
+IDLE_TIMEOUT = 30 * 60
+# seconds between checks for idle games
+REAP_INTERVAL = 60
+
+
+class SessionEvicted(Exception):
+    """Put in a game's input queue to end it, raised from the game's input() when it gets there.
+
+    Attrs:
+        keep_snapshot -- if True the game's snapshot is kept so it can be resumed, otherwise the game just ends
+    """
+    def __init__(self, keep_snapshot: bool = True):
+        super().__init__('session evicted')
+        self.keep_snapshot = keep_snapshot
+
+
+def deep_sizeof(*objs) -> int:
+    """Estimate the memory used by some objects and everything they refer to, except modules, classes and functions."""
+    seen = set()
+    size = 0
+    to_visit = list(objs)
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        to_visit.extend(gc.get_referents(obj))
+    return size
+
+
+class GameSessions:
+    """Live games keyed by channel id, with an idle timeout and a cap on how many can be live at once.
+
+    Used like the dict of games it replaces. When a game is added past the cap, the least recently active game
+    is evicted, and a background task evicts games nobody has sent input to for the idle timeout.
+    Evicted games keep their snapshot by default, so they can be resumed later.
+
+    Attrs:
+        max_live -- most games that can be live at once
+        idle_timeout -- seconds without input before a game is evicted
+        keep_snapshots -- whether evicted games keep their snapshot, or end for good
+        evictions -- how many games have been evicted
+    """
+    def __init__(self, max_live: int = MAX_LIVE_SESSIONS, idle_timeout: float = IDLE_TIMEOUT,
+                 keep_snapshots: bool = True):
+        self.max_live = max_live
+        self.idle_timeout = idle_timeout
+        self.keep_snapshots = keep_snapshots
+        self.evictions = 0
+        # least recently active first
+        self.games = collections.OrderedDict()
+        self.last_active = {}
+
+    def __contains__(self, channel_id):
+        return channel_id in self.games
+
+    def __getitem__(self, channel_id):
+        return self.games[channel_id]
+
+    def __len__(self):
+        return len(self.games)
+
+    def __setitem__(self, channel_id, game_instance):
+        self.games[channel_id] = game_instance
+        self.touch(channel_id)
+        while len(self.games) > self.max_live:
+            self.evict(next(iter(self.games)))
+
+    def values(self):
+        return self.games.values()
+
+    def remove(self, game_instance):
+        """Remove a game that has ended, if it's still the live game for its channel."""
+        channel_id = game_instance.send_channel.id
+        if self.games.get(channel_id) is game_instance:
+            del self.games[channel_id]
+            del self.last_active[channel_id]
+
+    def touch(self, channel_id):
+        """Mark a channel's game as active now."""
+        if channel_id in self.games:
+            self.games.move_to_end(channel_id)
+            self.last_active[channel_id] = time.monotonic()
+
+    def evict(self, channel_id):
+        """Stop a game, it ends the next time it waits for input."""
+        game_instance = self.games.pop(channel_id)
+        del self.last_active[channel_id]
+        self.evictions += 1
+        game_instance.evict(SessionEvicted(self.keep_snapshots))
+
+    def evict_idle(self):
+        """Evict every game that has been idle for longer than the timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        # games are ordered by activity, so stop at the first one that's recent enough
+        for channel_id in list(self.games):
+            if self.last_active[channel_id] > cutoff:
+                break
+            self.evict(channel_id)
+
+    async def reap(self, interval: float = REAP_INTERVAL):
+        """Evict idle games forever, run this as a background task."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    def stats(self, with_memory: bool = True) -> dict:
+        """Get counts and, if with_memory, the average memory per live game in bytes.
+
+        The memory estimate walks every game's world, so leave it out for frequent reports.
+        """
+        live = len(self.games)
+        stats = {
+            'live_sessions': live,
+            'max_live_sessions': self.max_live,
+            'evictions': self.evictions,
+        }
+        if not with_memory:
+            return stats
+
+        if live:
+            memory = deep_sizeof(*(game_instance.world_objects() for game_instance in self.games.values()))
+            memory_per_session = memory // live
+        else:
+            memory_per_session = 0
+        stats['memory_per_session'] = memory_per_session
+        return stats
@@ -0,0 +1,82 @@
+import os
+import zlib
+import json
+
+
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_EXT = '.snap'
+# first bytes of every snapshot file, the last byte is the format version
+# version 2 stores things by their world file keys instead of their names
+# version 3 is json instead of pickle, so a snapshot can only ever be data, never code to run
+MAGIC = b'ZSN\x03'
+
+# ids of channels that have a snapshot saved, so checking a channel doesn't touch the disk
+saved_channels = set()
+
+
+def snapshot_path(channel_id) -> str:
+    return os.path.join(SNAPSHOT_DIR, f'{channel_id}{SNAPSHOT_EXT}')
+
+
+def scan():
+    """Find the channels with saved snapshots, call this once when the bot starts."""
+    saved_channels.clear()
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    for file_name in os.listdir(SNAPSHOT_DIR):
+        channel_id, ext = os.path.splitext(file_name)
+        if ext == SNAPSHOT_EXT and channel_id.isdigit():
+            saved_channels.add(int(channel_id))
+
+
+def has_snapshot(channel_id) -> bool:
+    return channel_id in saved_channels
+
+
+def dumps(state: dict) -> bytes:
+    """Encode a game state dict of json values as compressed binary.
+
+    Tuples come back as lists, and dict keys as strings.
+    """
+    return MAGIC + zlib.compress(json.dumps(state, separators=(',', ':')).encode())
+
+
+def loads(data: bytes) -> dict:
+    """Decode a game state from dumps(), raising ValueError if it isn't a snapshot of this format version."""
+    if not data.startswith(MAGIC):
+        raise ValueError('not a snapshot, or an unsupported version')
+    state = json.loads(zlib.decompress(data[len(MAGIC):]))
+    if not isinstance(state, dict):
+        raise ValueError('not a game state')
+    return state
+
+
+def save(channel_id, state: dict):
+    """Write a channel's snapshot, replacing any old one in one step so a crash can't leave half a file.
+
+    This does blocking I/O, so games run it in an executor.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(channel_id)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(dumps(state))
+    os.replace(temp_path, path)
+    saved_channels.add(channel_id)
+
+
+def load(channel_id):
+    """Read a channel's snapshot, or get None if it doesn't have a usable one."""
+    try:
+        with open(snapshot_path(channel_id), 'rb') as snapshot_file:
+            return loads(snapshot_file.read())
+    except (OSError, ValueError, zlib.error):
+        return None
+
+
+def delete(channel_id):
+    saved_channels.discard(channel_id)
+    try:
+        os.remove(snapshot_path(channel_id))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,219 @@
+import random
+
+from .world import compile_world, register_world, get_world, WorldTemplate, UNREACHED
+from .strings import get_catalog
+from .zarya_discord import USE_HANDLERS
+
+
+# directions ports face, each with the direction of the port facing back and the step it makes on the station's grid
+DIRECTIONS = {
+    'front': ('aft', (1, 0, 0)),
+    'aft': ('front', (-1, 0, 0)),
+    'starboard': ('port', (0, 1, 0)),
+    'port': ('starboard', (0, -1, 0)),
+    'zenith': ('nadir', (0, 0, 1)),
+    'nadir': ('zenith', (0, 0, -1)),
+}
+MODULE_KINDS = ('node', 'lab', 'habitat', 'airlock', 'storage module', 'service module', 'cupola')
+ITEM_KINDS = (
+    'spanner', 'checklist', 'sample bag', 'torch', 'cable', 'food pouch', 'water bag', 'filter', 'sock', 'pen',
+)
+# items with use handlers a module may have, as strings prefixes and handlers
+FIXTURES = (('items.greenhouse', 'use_greenhouse'), ('items.toilet', 'use_toilet'), ('items.bed', 'use_bed'))
+# new modules are attached to one of this many most recent modules, so the station grows in long arms like the ISS
+ATTACH_WINDOW = 20
+# chance of the hatch between neighbouring modules that aren't already connected being open
+LOOP_CHANCE = 0.3
+# chance of a port with nothing on the other side, like a docking port
+DOCKING_PORT_CHANCE = 0.2
+# chance of a module having lockers with some of its items in them
+LOCKERS_CHANCE = 0.3
+FIXTURE_CHANCE = 0.1
+
+
+def generate_station(modules: int, items_per_module: int = 10, seed=0) -> dict:
+    """Generate the definition of an ISS-like station, in the world file format.
+
+    Modules sit on a 3D grid and connect to their neighbours through ports facing the matching directions. The
+    station grows from one module by attaching each new one to a free side of a recent one, then some modules
+    that end up next to each other are connected too, making loops. The start module has the laptop and drive.
+
+    Args:
+        modules -- how many modules the station has
+        items_per_module -- average number of items in each module
+        seed -- seed for the random layout, the same arguments always generate the same station
+    """
+    rng = random.Random(seed)
+    positions = [(0, 0, 0)]
+    module_at = {(0, 0, 0): 0}
+    # (module, direction) to (the module the port leads into or None, whether it's open)
+    links = {}
+
+    for module in range(1, modules):
+        while True:
+            parent = rng.randrange(max(0, module - ATTACH_WINDOW), module)
+            direction = rng.choice(tuple(DIRECTIONS))
+            back, step = DIRECTIONS[direction]
+            position = tuple(a + b for a, b in zip(positions[parent], step))
+            if position not in module_at:
+                break
+        positions.append(position)
+        module_at[position] = module
+        links[parent, direction] = (module, True)
+        links[module, back] = (parent, True)
+
+    for module, position in enumerate(positions):
+        for direction, (back, step) in DIRECTIONS.items():
+            if (module, direction) in links:
+                continue
+            neighbour = module_at.get(tuple(a + b for a, b in zip(position, step)))
+            if neighbour is not None:
+                # the port on the other side gets the same state
+                is_open = rng.random() < LOOP_CHANCE
+                links[module, direction] = (neighbour, is_open)
+                links[neighbour, back] = (module, is_open)
+            elif rng.random() < DOCKING_PORT_CHANCE:
+                links[module, direction] = (None, False)
+
+    items = {
+        'laptop': {'type': 'laptop', 'strings': 'items.laptop', 'use': 'use_laptop', 'take': True},
+        'drive': {
+            'strings': 'items.drive', 'use': 'use_drive', 'take': True,
+            'files': {'program.py': "'print('hello world!')'"},
+        },
+    }
+    containers = {}
+    rooms = {}
+    for module in range(modules):
+        kind = rng.choice(MODULE_KINDS)
+        room_items = ['laptop', 'drive'] if module == 0 else []
+        for _ in range(rng.randint(0, 2 * items_per_module)):
+            key = f'i{len(items)}'
+            item_kind = rng.choice(ITEM_KINDS)
+            items[key] = {'name': item_kind, 'desc': f'a {item_kind}', 'take': True}
+            room_items.append(key)
+
+        room = {
+            'name': f'{kind} {module}',
+            'desc': f'in {kind} {module}',
+            'windows': kind == 'cupola',
+            'ports': [],
+        }
+        for direction in DIRECTIONS:
+            if (module, direction) in links:
+                target, is_open = links[module, direction]
+                room['ports'].append([direction] if target is None else [direction, f'm{target}', is_open])
+        if room_items and rng.random() < LOCKERS_CHANCE:
+            split = rng.randint(0, len(room_items))
+            containers[f'm{module}_lockers'] = {
+                'name': 'lockers', 'desc': 'looking in the lockers', 'items': room_items[split:],
+            }
+            room_items = room_items[:split]
+            room['containers'] = [f'm{module}_lockers']
+        # fixtures can't be taken, so they're never in lockers
+        if rng.random() < FIXTURE_CHANCE:
+            key = f'i{len(items)}'
+            strings, use = rng.choice(FIXTURES)
+            items[key] = {'strings': strings, 'use': use}
+            room_items.append(key)
+        room['items'] = room_items
+        rooms[f'm{module}'] = room
+
+    return {'start': 'm0', 'items': items, 'containers': containers, 'rooms': rooms}
+
+
+def station_name(modules: int, items_per_module: int = 10, seed=0) -> str:
+    return f'station-{modules}-{items_per_module}-{seed}'
+
+
+def get_station(modules: int, items_per_module: int = 10, seed=0) -> WorldTemplate:
+    """Get a generated station's world template, generating and compiling it the first time.
+
+    Games can play it by passing its name, station_name() or the template's name attribute, as their world.
+    """
+    name = station_name(modules, items_per_module, seed)
+    try:
+        return get_world(name)
+    except FileNotFoundError:
+        pass
+    world = compile_world(name, generate_station(modules, items_per_module, seed), USE_HANDLERS, get_catalog())
+    register_world(world)
+    return world
+
+
+def station_script(world: WorldTemplate, length: int, seed=0, catalog=None) -> list:
+    """Make a script of inputs that wanders round a world, for stress testing with a HeadlessGame.
+
+    The script keeps track of where it is and what's where, so it hits every kind of command lookup: looking,
+    going through open, closed and missing ports, travelling to modules that do and don't exist, searching
+    containers, taking and dropping items that are and aren't there, using things that can't be used, the
+    inventory, and commands that don't exist.
+    Nothing is used that would ask for more input.
+    """
+    if catalog is None:
+        catalog = get_catalog()
+    rng = random.Random(seed)
+
+    def name(spec):
+        return spec.name if spec.strings is None else catalog[f'game.{spec.strings}.name']
+
+    def item_name(item_id):
+        return name(world.items[item_id])
+
+    # rooms the script has changed, room id to the item ids in it
+    room_items = {}
+    inventory = []
+    room_id = world.start_room
+    script = []
+    while len(script) < length:
+        items_here = room_items.setdefault(room_id, list(world.rooms[room_id].items))
+        ports = world.ports(room_id)
+        choice = rng.random()
+        if choice < 0.35 and ports:
+            port = rng.choice(ports)
+            script.append(f'go through {world.port_names[port]} port')
+            if world.port_open[port]:
+                room_id = world.port_targets[port]
+                script.append('look around')
+        elif choice < 0.4:
+            target = rng.randrange(len(world.rooms))
+            script.append(f'travel to {name(world.rooms[target])}')
+            if target != room_id and world.route_tree(room_id)[target] != UNREACHED:
+                room_id = target
+                script.append('look around')
+        elif choice < 0.5 and items_here:
+            item_id = rng.choice(items_here)
+            script.append(f'take {item_name(item_id)}')
+            if world.items[item_id].can_take:
+                # the game takes the first item with the name, which may not be this one, but it has the same name
+                taken = next(
+                    i for i in items_here if item_name(i) == item_name(item_id) and world.items[i].can_take
+                )
+                items_here.remove(taken)
+                inventory.append(taken)
+        elif choice < 0.6 and world.rooms[room_id].containers:
+            container_id = world.rooms[room_id].containers[0]
+            container = world.containers[container_id]
+            script.append(f'search {name(container)}')
+            script.append('take all')
+            script.append('leave')
+            container_items = room_items.setdefault(('container', container_id), list(container.items))
+            inventory.extend(container_items)
+            container_items.clear()
+        elif choice < 0.7 and inventory:
+            item_id = inventory.pop(rng.randrange(len(inventory)))
+            script.append(f'drop {item_name(item_id)}')
+            items_here.append(item_id)
+        elif choice < 0.75:
+            script.append('show inventory')
+        elif choice < 0.8:
+            script.append(rng.choice((
+                'take unicorn', 'go through sideways port', 'travel to mars', 'dance', 'search nothing',
+            )))
+        elif choice < 0.85 and inventory:
+            # only things without a use handler, so nothing asks for more input
+            unusable = [i for i in inventory if world.items[i].use is None]
+            script.append(f'use {item_name(rng.choice(unusable))}' if unusable else 'show inventory')
+        else:
+            script.append('look around')
+    return script
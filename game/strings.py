@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import string
+
+
+STRINGS_DIR = 'strings'
+DEFAULT_LANG = 'en'
+GUILD_LANGS_FILE = 'guild_languages.json'
+
+_formatter = string.Formatter()
+
+
+class StringCatalog:
+    """Player-facing strings for one locale.
+
+    The locale's JSON tree is flattened to dotted keys like 'game.commands.take.success' when it's loaded, every
+    string is interned, and strings with {fields} get their format method stored so nothing is parsed per use.
+    Keys missing from a locale fall back to the default locale, sharing its string objects.
+
+    Attrs:
+        lang -- locale code, the name of the file in the strings directory
+        tree -- the locale's JSON as nested dicts, for code that still reads it directly
+    """
+    def __init__(self, lang: str, tree: dict, fallback=None):
+        self.lang = lang
+        self.tree = tree
+        if fallback is None:
+            self.strings = {}
+            self.templates = {}
+        else:
+            self.strings = dict(fallback.strings)
+            self.templates = dict(fallback.templates)
+        self.static_strings = {}
+
+        for key, value in flatten(tree):
+            value = sys.intern(value)
+            self.strings[key] = value
+            has_fields = any(field_name is not None for _, field_name, _, _ in _formatter.parse(value))
+            self.templates[key] = value.format if has_fields else None
+
+    def __getitem__(self, key: str) -> str:
+        return self.strings[key]
+
+    def get(self, key: str, default=None):
+        return self.strings.get(key, default)
+
+    def format(self, key: str, **kwargs) -> str:
+        """Get a string with its {fields} filled in, or just the string if it doesn't have any."""
+        template = self.templates[key]
+        if template is None:
+            return self.strings[key]
+        return template(**kwargs)
+
+    def format_static(self, key: str, **kwargs) -> str:
+        """Like format(), for strings that are always given the same values, so they're only formatted once."""
+        text = self.static_strings.get(key)
+        if text is None:
+            text = self.static_strings[key] = self.format(key, **kwargs)
+        return text
+
+
+def flatten(tree: dict, prefix: str = ''):
+    """Yield (dotted key, string) for every string in a nested dict."""
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, str):
+            yield f'{prefix}{key}', value
+
+
+# locales are only loaded the first time they're used
+_catalogs = {}
+
+
+def available_langs() -> list:
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(STRINGS_DIR) if name.endswith('.json'))
+
+
+def get_catalog(lang: str = DEFAULT_LANG) -> StringCatalog:
+    """Get the catalog for a locale, loading it if it hasn't been used yet.
+
+    Raises:
+        FileNotFoundError -- there's no strings file for the locale
+    """
+    catalog = _catalogs.get(lang)
+    if catalog is None:
+        with open(os.path.join(STRINGS_DIR, f'{lang}.json'), encoding='utf-8') as strings_file:
+            tree = json.load(strings_file)
+        fallback = None if lang == DEFAULT_LANG else get_catalog(DEFAULT_LANG)
+        catalog = _catalogs[lang] = StringCatalog(lang, tree, fallback)
+    return catalog
+
+
+# guild id to locale code, loaded the first time a guild's language is looked up
+_guild_langs = None
+
+
+def _load_guild_langs() -> dict:
+    global _guild_langs
+    if _guild_langs is None:
+        try:
+            with open(GUILD_LANGS_FILE) as guild_langs_file:
+                _guild_langs = {int(guild_id): lang for guild_id, lang in json.load(guild_langs_file).items()}
+        except FileNotFoundError:
+            _guild_langs = {}
+    return _guild_langs
+
+
+def guild_lang(guild_id) -> str:
+    """Get the locale a guild has chosen, or the default. guild_id may be None for DMs."""
+    if guild_id is None:
+        return DEFAULT_LANG
+    return _load_guild_langs().get(guild_id, DEFAULT_LANG)
+
+
+def set_guild_lang(guild_id, lang: str):
+    """Choose a guild's locale and save the choice.
+
+    Raises:
+        ValueError -- there's no strings file for the locale
+    """
+    if lang not in available_langs():
+        raise ValueError(f'no strings for language {lang!r}')
+    guild_langs = _load_guild_langs()
+    guild_langs[guild_id] = lang
+    with open(GUILD_LANGS_FILE, 'w') as guild_langs_file:
+        json.dump(guild_langs, guild_langs_file)
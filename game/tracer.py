@@ -0,0 +1,159 @@
+import time
+import heapq
+import itertools
+import contextvars
+
+
+# how many of the slowest commands to keep
+TOP_N = 20
+# the kinds of awaiting a trace counts, which are trace attributes
+DISCORD = 'discord'
+WAITING = 'waiting'
+
+
+class CommandTrace:
+    """Timings of one command, from process_command.
+
+    Attrs:
+        session -- session id from the game's log
+        channel -- id of the game's channel
+        command -- the input that was done
+        handler -- name of the handler that did it, or the item's use_ handler for the use command
+        outer -- trace of the command this one is being done inside, like use laptop's, or None
+        wall -- seconds the command took
+        discord -- seconds spent awaiting output to discord
+        waiting -- seconds spent waiting for the player's input, at a prompt
+        cpu -- CPU seconds used, not counting what other games used while this one awaited discord or input
+    """
+    __slots__ = (
+        'session', 'channel', 'command', 'handler', 'outer', 'wall', 'discord', 'waiting', 'cpu', 'awaited_cpu',
+        'started', 'cpu_started', 'token',
+    )
+
+    def __init__(self, session: str, channel: int, command: str, handler: str, outer=None):
+        self.session = session
+        self.channel = channel
+        self.command = command
+        self.handler = handler
+        self.outer = outer
+        self.wall = 0
+        self.discord = 0
+        self.waiting = 0
+        self.cpu = 0
+        # CPU time used while awaiting, mostly by other games, which is taken off this one's
+        self.awaited_cpu = 0
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.token = None
+
+    @property
+    def busy(self) -> float:
+        """Seconds the command took apart from waiting for the player, which is what it's ranked by."""
+        return self.wall - self.waiting
+
+
+# the trace of the command being done in the current task, None if it isn't being traced
+current = contextvars.ContextVar('command_trace', default=None)
+enabled = False
+top_n = TOP_N
+# the slowest commands as a min heap of (busy seconds, order, trace)
+slowest = []
+# handler name to [commands, wall, discord, waiting, cpu] totals
+totals = {}
+_order = itertools.count()
+
+
+def start(top: int = TOP_N):
+    """Start tracing commands, forgetting any traced before."""
+    global enabled, top_n
+    enabled = True
+    top_n = top
+    slowest.clear()
+    totals.clear()
+
+
+def stop():
+    """Stop tracing commands, what's been traced is kept for report()."""
+    global enabled
+    enabled = False
+
+
+def begin(session: str, channel: int, command: str, handler: str) -> CommandTrace:
+    """Start a command's trace and make it the current task's, call end() with it when the command is done."""
+    trace = CommandTrace(session, channel, command, handler, current.get())
+    trace.token = current.set(trace)
+    return trace
+
+
+def end(trace: CommandTrace):
+    """Finish a command's trace and keep it if it's one of the slowest."""
+    trace.wall = time.perf_counter() - trace.started
+    trace.cpu = time.thread_time() - trace.cpu_started - trace.awaited_cpu
+    current.reset(trace.token)
+    trace.outer = trace.token = None
+
+    handler_totals = totals.get(trace.handler)
+    if handler_totals is None:
+        handler_totals = totals[trace.handler] = [0, 0, 0, 0, 0]
+    handler_totals[0] += 1
+    handler_totals[1] += trace.wall
+    handler_totals[2] += trace.discord
+    handler_totals[3] += trace.waiting
+    handler_totals[4] += trace.cpu
+
+    entry = (trace.busy, next(_order), trace)
+    if len(slowest) < top_n:
+        heapq.heappush(slowest, entry)
+    elif entry > slowest[0]:
+        heapq.heapreplace(slowest, entry)
+
+
+def await_started():
+    """Note when the current task starts awaiting something, or None if it isn't doing a traced command.
+
+    Pass what this returns to await_ended() when the await is done.
+    """
+    if current.get() is None:
+        return None
+    return time.perf_counter(), time.thread_time()
+
+
+def await_ended(started, kind: str):
+    """Count the time since await_started() as awaiting a kind of thing, DISCORD or WAITING.
+
+    It counts for every command the current one is being done inside as well, so use laptop isn't counted as slow
+    for waiting on the commands done on the laptop.
+    """
+    if started is None:
+        return
+    seconds = time.perf_counter() - started[0]
+    cpu = time.thread_time() - started[1]
+    trace = current.get()
+    while trace is not None:
+        setattr(trace, kind, getattr(trace, kind) + seconds)
+        trace.awaited_cpu += cpu
+        trace = trace.outer
+
+
+def report() -> str:
+    """Get a table of the slowest commands and a table of totals by handler, times in ms."""
+    lines = [
+        f"Tracing {'on' if enabled else 'off'}. Slowest {len(slowest)} commands, by time not waiting for input:",
+        f"{'busy':>8} {'wall':>8} {'discord':>8} {'cpu':>8}  {'handler':<18} {'session':<8} {'channel':<19} command",
+    ]
+    for busy, order, trace in sorted(slowest, reverse=True):
+        lines.append(
+            f'{busy * 1000:8.1f} {trace.wall * 1000:8.1f} {trace.discord * 1000:8.1f} {trace.cpu * 1000:8.1f}  '
+            f'{trace.handler:<18} {trace.session:<8} {trace.channel:<19} {trace.command}'
+        )
+
+    lines.append('')
+    lines.append('By handler, averages:')
+    lines.append(f"{'count':>8} {'busy':>8} {'wall':>8} {'discord':>8} {'cpu':>8}  handler")
+    by_busy = sorted(totals.items(), key=lambda item: item[1][1] - item[1][3], reverse=True)
+    for handler, (count, wall, discord, waiting, cpu) in by_busy:
+        lines.append(
+            f'{count:8} {(wall - waiting) / count * 1000:8.1f} {wall / count * 1000:8.1f} '
+            f'{discord / count * 1000:8.1f} {cpu / count * 1000:8.1f}  {handler}'
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,308 @@
+import os
+import json
+import types
+import collections
+
+from array import array
+from typing import NamedTuple, Optional, Tuple
+
+
+WORLDS_DIR = 'worlds'
+DEFAULT_WORLD = 'iss'
+# item types a world file can use, the game maps them to item classes
+ITEM_TYPES = ('item', 'laptop')
+# port_targets value for a port with nothing on the other side
+NOWHERE = -1
+# route tree values for the room a route starts from, and rooms it can't get to
+START = -1
+UNREACHED = -2
+# most route trees a world keeps for games that haven't opened or closed any ports
+ROUTE_CACHE_SIZE = 256
+
+
+class WorldError(ValueError):
+    """A world file that doesn't describe a valid world."""
+
+
+class ItemSpec(NamedTuple):
+    key: str
+    type: str
+    # prefix under 'game.' in the strings file for the name and desc, or None if they're given inline
+    strings: Optional[str]
+    name: Optional[str]
+    desc: Optional[str]
+    # name of the ZaryaGame method run when the item is used, or None if it can't be used
+    use: Optional[str]
+    can_take: bool
+    # (file name, contents) pairs for items that store files, or None
+    files: Optional[Tuple[Tuple[str, str], ...]]
+
+
+class ContainerSpec(NamedTuple):
+    key: str
+    strings: Optional[str]
+    name: Optional[str]
+    desc: Optional[str]
+    items: Tuple[int, ...]
+
+
+class RoomSpec(NamedTuple):
+    key: str
+    strings: Optional[str]
+    name: Optional[str]
+    desc: Optional[str]
+    has_windows: bool
+    items: Tuple[int, ...]
+    containers: Tuple[int, ...]
+
+
+class WorldTemplate:
+    """A world file compiled into a read-only graph that every game on the world builds its copy from.
+
+    Items, containers and rooms are referred to by integer ids, their indexes in the spec tuples. Ports are kept
+    in flat arrays: room i's ports are the indexes from port_start[i] up to port_start[i + 1], each with a name in
+    port_names, the id of the room it leads into in port_targets, or NOWHERE, and whether it starts out open in
+    port_open. port_rooms has the id of the room each port is in.
+
+    Attrs:
+        name -- name of the world file
+        items -- tuple of ItemSpecs
+        containers -- tuple of ContainerSpecs
+        rooms -- tuple of RoomSpecs
+        port_start
+        port_names
+        port_targets
+        port_open
+        port_rooms
+        start_room -- id of the room games start in
+        wearing -- what the player starts out wearing
+        item_ids, container_ids, room_ids -- read-only mappings of keys to ids
+    """
+    def __init__(self, name: str, items, containers, rooms, port_start, port_names, port_targets, port_open,
+                 start_room: int, wearing: str):
+        self.name = name
+        self.items = tuple(items)
+        self.containers = tuple(containers)
+        self.rooms = tuple(rooms)
+        self.port_start = array('l', port_start)
+        self.port_names = tuple(port_names)
+        self.port_targets = array('l', port_targets)
+        self.port_open = array('b', port_open)
+        self.port_rooms = array('l', (
+            room_id for room_id in range(len(self.rooms)) for _ in range(port_start[room_id], port_start[room_id + 1])
+        ))
+        self.start_room = start_room
+        self.wearing = wearing
+        self.item_ids = types.MappingProxyType({spec.key: i for i, spec in enumerate(self.items)})
+        self.container_ids = types.MappingProxyType({spec.key: i for i, spec in enumerate(self.containers)})
+        self.room_ids = types.MappingProxyType({spec.key: i for i, spec in enumerate(self.rooms)})
+        # route trees from rooms, with every port as it starts out, least recently used first
+        self._routes = collections.OrderedDict()
+
+    def ports(self, room_id: int) -> range:
+        """Get the indexes of a room's ports in port_names and port_targets."""
+        return range(self.port_start[room_id], self.port_start[room_id + 1])
+
+    def route_tree(self, source: int) -> array:
+        """Get the route tree from a room with every port as it starts out, see route_tree()."""
+        came_by = self._routes.get(source)
+        if came_by is None:
+            came_by = self._routes[source] = route_tree(self, source, self.port_open)
+            if len(self._routes) > ROUTE_CACHE_SIZE:
+                self._routes.popitem(last=False)
+        else:
+            self._routes.move_to_end(source)
+        return came_by
+
+
+def route_tree(world: WorldTemplate, source: int, port_open: array) -> array:
+    """Search out from a room through open ports, breadth first, for the shortest routes to every other room.
+
+    Args:
+        world
+        source -- id of the room to start from
+        port_open -- array of whether each port is open, like the world's
+
+    Returns:
+        an array with the index of the port each room is entered through on its shortest route from source,
+        START for source itself, or UNREACHED if there's no route
+    """
+    came_by = array('l', [UNREACHED]) * len(world.rooms)
+    came_by[source] = START
+    port_start = world.port_start
+    port_targets = world.port_targets
+    queue = collections.deque([source])
+    while queue:
+        room_id = queue.popleft()
+        for port in range(port_start[room_id], port_start[room_id + 1]):
+            target = port_targets[port]
+            if port_open[port] and came_by[target] == UNREACHED:
+                came_by[target] = port
+                queue.append(target)
+    return came_by
+
+
+def route_to(world: WorldTemplate, came_by: array, target: int):
+    """Get the indexes of the ports on the route to a room from a route tree, in order, or None if there's no route."""
+    if came_by[target] == UNREACHED:
+        return None
+    route = []
+    while came_by[target] != START:
+        port = came_by[target]
+        route.append(port)
+        target = world.port_rooms[port]
+    route.reverse()
+    return route
+
+
+def _text_fields(where: str, definition: dict, catalog) -> tuple:
+    """Get (strings prefix, name, desc) for a definition, which has a strings prefix or an inline name and desc."""
+    prefix = definition.get('strings')
+    if prefix is not None:
+        if catalog is not None:
+            for field in ('name', 'desc'):
+                if catalog.get(f'game.{prefix}.{field}') is None:
+                    raise WorldError(f'{where}: no string game.{prefix}.{field}')
+        return prefix, None, None
+    name, desc = definition.get('name'), definition.get('desc')
+    if not isinstance(name, str) or not isinstance(desc, str):
+        raise WorldError(f'{where}: needs a strings prefix, or a name and desc')
+    return None, name, desc
+
+
+def _refs(where: str, keys, ids: dict, kind: str, placed: dict) -> tuple:
+    """Look up the ids of things placed somewhere, making sure each thing is only placed once."""
+    refs = []
+    for key in keys:
+        if key not in ids:
+            raise WorldError(f'{where}: unknown {kind} {key!r}')
+        if key in placed:
+            raise WorldError(f'{where}: {kind} {key!r} is already in {placed[key]}')
+        placed[key] = where
+        refs.append(ids[key])
+    return tuple(refs)
+
+
+def compile_world(name: str, definition: dict, handlers=(), catalog=None) -> WorldTemplate:
+    """Validate a world definition, as loaded from a world file, and compile it into a WorldTemplate.
+
+    Args:
+        name -- name of the world, for error messages
+        definition -- the world file's JSON
+        handlers -- names item use handlers may have
+        catalog -- StringCatalog to check strings prefixes against, or None to not check them
+
+    Raises:
+        WorldError -- the definition isn't a valid world, the message says where
+    """
+    try:
+        item_defs = definition['items']
+        container_defs = definition.get('containers', {})
+        room_defs = definition['rooms']
+        start = definition['start']
+    except (KeyError, TypeError):
+        raise WorldError(f'{name}: needs items, rooms and start')
+    handlers = set(handlers)
+
+    items = []
+    for key, item_def in item_defs.items():
+        where = f'{name}: items.{key}'
+        item_type = item_def.get('type', 'item')
+        if item_type not in ITEM_TYPES:
+            raise WorldError(f'{where}: unknown type {item_type!r}')
+        use = item_def.get('use')
+        if use is not None and use not in handlers:
+            raise WorldError(f'{where}: unknown use handler {use!r}')
+        files = item_def.get('files')
+        if files is not None:
+            files = tuple(files.items())
+        items.append(ItemSpec(
+            key, item_type, *_text_fields(where, item_def, catalog), use, bool(item_def.get('take', False)), files
+        ))
+    item_ids = {spec.key: i for i, spec in enumerate(items)}
+    # key to where it was placed, for catching things placed twice
+    placed_items = {}
+    placed_containers = {}
+
+    containers = []
+    for key, container_def in container_defs.items():
+        where = f'{name}: containers.{key}'
+        containers.append(ContainerSpec(
+            key, *_text_fields(where, container_def, catalog),
+            _refs(where, container_def.get('items', ()), item_ids, 'item', placed_items)
+        ))
+    container_ids = {spec.key: i for i, spec in enumerate(containers)}
+
+    room_ids = {key: i for i, key in enumerate(room_defs)}
+    if start not in room_ids:
+        raise WorldError(f'{name}: start room {start!r} is not a room')
+    rooms = []
+    port_start = []
+    port_names = []
+    port_targets = []
+    port_open = []
+    for key, room_def in room_defs.items():
+        where = f'{name}: rooms.{key}'
+        rooms.append(RoomSpec(
+            key, *_text_fields(where, room_def, catalog), bool(room_def.get('windows', False)),
+            _refs(where, room_def.get('items', ()), item_ids, 'item', placed_items),
+            _refs(where, room_def.get('containers', ()), container_ids, 'container', placed_containers),
+        ))
+
+        port_start.append(len(port_names))
+        room_port_names = set()
+        for port_def in room_def.get('ports', ()):
+            if not isinstance(port_def, list) or not 1 <= len(port_def) <= 3:
+                raise WorldError(f'{where}: ports must be [name], [name, room] or [name, room, open], not {port_def!r}')
+            port_name = port_def[0]
+            if port_name in room_port_names:
+                raise WorldError(f'{where}: two ports named {port_name!r}')
+            room_port_names.add(port_name)
+            if len(port_def) >= 2:
+                if port_def[1] not in room_ids:
+                    raise WorldError(f'{where}: port {port_name!r} leads into unknown room {port_def[1]!r}')
+                target = room_ids[port_def[1]]
+                is_open = port_def[2] if len(port_def) == 3 else True
+                if not isinstance(is_open, bool):
+                    raise WorldError(f'{where}: port {port_name!r} must be open true or false, not {is_open!r}')
+            else:
+                target = NOWHERE
+                is_open = False
+            port_names.append(port_name)
+            port_targets.append(target)
+            port_open.append(is_open)
+    port_start.append(len(port_names))
+
+    wearing = definition.get('player', {}).get('wearing', 'jumpsuit')
+    return WorldTemplate(
+        name, items, containers, rooms, port_start, port_names, port_targets, port_open, room_ids[start], wearing
+    )
+
+
+# worlds are only loaded and compiled the first time they're used
+_worlds = {}
+
+
+def get_world(name: str = DEFAULT_WORLD, handlers=(), catalog=None) -> WorldTemplate:
+    """Get the template for a world file, loading and compiling it if it hasn't been used yet.
+
+    handlers and catalog are only used to validate the world the first time it's loaded, see compile_world().
+
+    Raises:
+        FileNotFoundError -- there's no world file with that name
+        WorldError -- the world file isn't valid
+    """
+    world = _worlds.get(name)
+    if world is None:
+        with open(os.path.join(WORLDS_DIR, f'{name}.json'), encoding='utf-8') as world_file:
+            try:
+                definition = json.load(world_file)
+            except ValueError as e:
+                raise WorldError(f'{name}: {e}')
+        world = _worlds[name] = compile_world(name, definition, handlers, catalog)
+    return world
+
+
+def register_world(world: WorldTemplate):
+    """Make a world that wasn't loaded from a file, like a generated one, available to get_world() by its name."""
+    _worlds[world.name] = world
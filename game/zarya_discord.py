@@ -1,14 +1,23 @@
-import os
+import sys
 import json
 import time
 import random
+import collections
 
-from typing import List, Callable
+from array import array
+from typing import List, Callable, Iterable
 # from tkinter import *
 
+import asyncio
+
 import aiohttp
 
-from .discord_funcs import discord_stutter, discord_input
+from . import game_log, snapshots, profiles, metrics, tracer
+from .browser import laptop_browser
+from .sessions import SessionEvicted
+from .discord_funcs import discord_stutter, hold_output, send_held_output, message_router, GameInput
+from .strings import get_catalog, DEFAULT_LANG
+from .world import get_world, route_tree, route_to, NOWHERE, DEFAULT_WORLD
 
 
 # idea: dungeon crawler mode? https://discord.com/channels/714154158969716780/736664393630220289/805862557033299992
@@ -26,66 +35,205 @@ __version__ = '0.11.0'
 # need to make this dynamic
 DISCORD_NAME = 'JMcB#7918'
 COPYRIGHT = '© Joel M 2017, 2021'
-LANG = 'en'
+# separates the commands in one message, which are done one after another with their output sent as one message
+BATCH_SEPARATOR = ';'
+# most route trees a station keeps once its ports are overridden, every game with its own ports has one of these
+STATION_ROUTE_CACHE_SIZE = 32
+LANG = DEFAULT_LANG
 # load strings
-with open(os.path.join('strings', f'{LANG}.json')) as strings_file:
-    STRINGS = json.load(strings_file)
+STRINGS = get_catalog(LANG).tree
 # strings shortcuts
 STRS_GAME = STRINGS['game']
 STRS_ITEMS = STRS_GAME['items']
 STRS_ROOMS = STRS_GAME['rooms']
 
 
-class ZaryaItem:
-    """Class for items.
+class ItemType:
+    """What every item of one kind shares, so items only have to keep their own state.
 
-    An item has a name and can be inspected for a description. It may be used, which will invoke usefunc, or taken.
+    Types are got with ItemType.get(), which gives the same object for the same values, so for instance every
+    nice picture shares one type, and every item from the same world file entry shares one per locale.
 
     Attrs:
         name
-        desc -- description of item
+        desc -- description of the item, without the desc stem
         can_use
         can_take
-        usefunc -- function to be run when the item is used
+        usefunc -- function to be run when an item of this type is used, or None
     """
+    __slots__ = ('name', 'desc', 'can_use', 'can_take', 'usefunc')
     desc_stem = STRS_ITEMS['desc_stem']
+    # (name, desc, can_use, can_take, usefunc) to the type with those values
+    _types = {}
 
     def __init__(self, name: str, desc: str, can_use: bool = False, can_take: bool = False, usefunc: Callable = None):
-        self.name = name
+        self.name = sys.intern(name)
         if desc.startswith(self.desc_stem):
             desc = desc.removeprefix(self.desc_stem)
-        self.desc = desc.strip()
+        self.desc = sys.intern(desc.strip())
         self.can_use = can_use
         self.can_take = can_take
-        if self.can_use and usefunc is not None:
-            self.usefunc = usefunc
+        self.usefunc = usefunc if can_use else None
+
+    @classmethod
+    def get(cls, name: str, desc: str, can_use: bool = False, can_take: bool = False, usefunc: Callable = None):
+        key = (name, desc, can_use, can_take, usefunc)
+        item_type = cls._types.get(key)
+        if item_type is None:
+            item_type = cls._types[key] = cls(name, desc, can_use, can_take, usefunc)
+        return item_type
+
+
+class ZaryaItem:
+    """Class for items.
+
+    An item has a name and can be inspected for a description. It may be used, which will invoke usefunc, or taken.
+    The name, description and uses are read from the item's ItemType, which it shares with every item like it.
+
+    Attrs:
+        item_type -- the ItemType with the rest of the attributes
+        name
+        desc -- description of item
+        can_use
+        can_take
+        usefunc -- function to be run when the item is used
+        key -- the item's key in the world file, None for items made during the game
+        files -- dict of file names to contents, only set on items that store files
+    """
+    __slots__ = ('item_type', 'key', 'files')
+
+    def __init__(self, name: str = None, desc: str = None, can_use: bool = False, can_take: bool = False,
+                 usefunc: Callable = None, item_type: ItemType = None, key: str = None):
+        if item_type is None:
+            item_type = ItemType.get(name, desc, can_use, can_take, usefunc)
+        self.item_type = item_type
+        self.key = key
+
+    @property
+    def name(self) -> str:
+        return self.item_type.name
+
+    @property
+    def desc(self) -> str:
+        return self.item_type.desc
+
+    @property
+    def can_use(self) -> bool:
+        return self.item_type.can_use
+
+    @property
+    def can_take(self) -> bool:
+        return self.item_type.can_take
+
+    @property
+    def usefunc(self):
+        return self.item_type.usefunc
 
     def __str__(self):
         return self.name
 
 
 class Picture(ZaryaItem):
-    """Subclass to distinguish pictures from other items."""
+    """Subclass to distinguish pictures from other items. Only the quality is kept per picture."""
+    __slots__ = ('quality',)
+
     def __init__(self, quality: int = None):
         if quality is None:
             quality = random.randint(1, 10)
         self.quality = quality
+        super().__init__(item_type=PICTURE_TYPES[self.picture_adj])
 
+    @property
+    def picture_adj(self) -> str:
         if self.quality <= 2:
-            self.picture_adj = 'rubbish'
+            return 'rubbish'
         elif self.quality <= 5:
-            self.picture_adj = 'nice'
+            return 'nice'
         else:
-            self.picture_adj = 'beautiful'
+            return 'beautiful'
+
 
-        super().__init__(name=f'{self.picture_adj} picture', desc=f'a {self.picture_adj} picture', can_take=True)
+# every picture of a quality band shares its type
+PICTURE_TYPES = {
+    adj: ItemType.get(name=f'{adj} picture', desc=f'a {adj} picture', can_take=True)
+    for adj in ('rubbish', 'nice', 'beautiful')
+}
 
 
 class Laptop(ZaryaItem):
     """Subclass for the laptop item, with additional attributes."""
-    powered_on = False
-    tutorial_done = False
-    files = {}
+    __slots__ = ('powered_on', 'tutorial_done')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.powered_on = False
+        self.tutorial_done = False
+        self.files = {}
+
+
+class ZaryaItemSpace:
+    """Class for an ordered collection of items, like a container's contents or an inventory.
+
+    It iterates like the list it replaces, but also keeps indexes by item name and by item type which are updated
+    on every append and remove, so finding, adding and removing an item doesn't scan the collection.
+    """
+    __slots__ = ('version', '_items', '_by_name', '_by_type')
+
+    def __init__(self, items: Iterable[ZaryaItem] = None):
+        # goes up whenever the contents change, for invalidating anything rendered from them
+        self.version = 0
+        # items compare by identity, so every index is an insertion ordered dict with the items as keys, which makes
+        # removal O(1) without storing anything else per item
+        self._items = {}
+        self._by_name = {}
+        self._by_type = {}
+        if items is not None:
+            for item in items:
+                self.append(item)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def append(self, item: ZaryaItem):
+        self.version += 1
+        self._items[item] = None
+        self._by_name.setdefault(item.name, {})[item] = None
+        self._by_type.setdefault(type(item), {})[item] = None
+
+    def remove(self, item: ZaryaItem):
+        """Remove an item, raising ValueError if it isn't here."""
+        if item not in self._items:
+            raise ValueError(f'{item} is not in this item space')
+        self.version += 1
+        del self._items[item]
+        for index, index_key in ((self._by_name, item.name), (self._by_type, type(item))):
+            del index[index_key][item]
+            if not index[index_key]:
+                del index[index_key]
+
+    def get(self, name: str):
+        """Get the first item with the given name, or None."""
+        items = self._by_name.get(name)
+        if not items:
+            return None
+        return next(iter(items))
+
+    def of_type(self, item_type: type) -> List[ZaryaItem]:
+        """Get a list of all the items of exactly the given type."""
+        return list(self._by_type.get(item_type, ()))
+
+    def first_of_type(self, item_type: type):
+        """Get the first item of exactly the given type, or None."""
+        items = self._by_type.get(item_type)
+        if not items:
+            return None
+        return next(iter(items))
 
 
 # TODO: allow giving an identifier to the constructor to automatically get the name and desc from the strings file
@@ -99,44 +247,65 @@ class ZaryaContainer:
         name
         desc -- look message of container
         can_leave -- whether you can leave the container, used in the ZaryaRoom subclass
-        items -- items in the container, a list of ZaryaItems or None
+        items -- items in the container, a ZaryaItemSpace
+        key -- the container's key in the world file
     """
-
+    __slots__ = ('name', 'desc', 'can_leave', 'has_windows', 'items', 'look_cache', 'key')
     desc_stem = STRS_GAME['containers']['desc_stem']
 
     def __init__(
             self, name: str, desc: str, can_leave: bool = True, has_windows: bool = False,
-            items: List[ZaryaItem] = None
+            items: List[ZaryaItem] = None, key: str = None
     ):
         self.name = name
         if desc.startswith(self.desc_stem):
             desc = desc.removeprefix(self.desc_stem)
-        self.desc = desc.strip()
+        # every copy of the world has its own containers, but they can share the text
+        self.desc = sys.intern(desc.strip())
         self.can_leave = can_leave
         self.has_windows = has_windows
-        if items is None:
-            self.items = []
-        else:
-            self.items = items
+        self.items = ZaryaItemSpace(items)
+        # (content version, rendered look output) from the last time someone looked around in here
+        self.look_cache = None
+        self.key = key
+
+    def content_version(self):
+        """Get a value that changes whenever what you'd see looking around in here changes."""
+        return self.items.version
 
 
 class ZaryaPort:
     """Class for ports connecting two modules of the station (rooms).
 
     A port has a name, which should correspond to a direction in orbit, like the ones used to describe ISS ports.
-    A port will be open or closed. If open, it may have a room which you will enter by going through it.
-    If closed, trying to get the room attribute may raise an AttributeError.
+    A port will be open or closed. If open, it has a room which you will enter by going through it.
+    Ports aren't stored on rooms, they're views of the station's port arrays which are made when they're needed.
 
     Attrs:
         name
         is_open
-        room -- if applicable, the ZaryaRoom which you will enter by going through the port
+        room -- the ZaryaRoom which you will enter by going through the port, or None if it's closed. The room is
+            only built the first time it's got
     """
-    def __init__(self, name: str, is_open: bool = False, room=None):
-        self.name = name
-        self.is_open = is_open
-        if self.is_open and room is not None:
-            self.room = room
+    __slots__ = ('station', 'index')
+
+    def __init__(self, station, index: int):
+        self.station = station
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self.station.world.port_names[self.index]
+
+    @property
+    def is_open(self) -> bool:
+        return self.station.is_port_open(self.index)
+
+    @property
+    def room(self):
+        if not self.is_open:
+            return None
+        return self.station.room(self.station.world.port_targets[self.index])
 
     def __str__(self):
         return self.name
@@ -152,44 +321,188 @@ class ZaryaRoom(ZaryaContainer):
         desc -- look message of room
         can_leave -- whether you can leave the room, should be False
         has_windows -- determines whether the camera can be used in this room
-        items -- items in the room, a list of ZaryaItems or None
-        containers -- a list of ZaryaContainers which you can enter, or None
-        ports -- a list of ZaryaPorts which may be open or closed, or None
+        items -- items in the room, a ZaryaItemSpace
+        containers -- a list of ZaryaContainers which you can enter
+        station -- the ZaryaStation the room is part of, or None if it isn't connected to anything
+        room_id -- the room's id in the station's world
+        ports -- a list of ZaryaPorts which may be open or closed, made each time it's got
     """
+    __slots__ = ('_containers', '_containers_by_name', 'station', 'room_id')
+
     def __init__(self, name: str, desc: str, can_leave: bool = False, has_windows: bool = False,
-                 items: List[ZaryaItem] = None, containers: List[ZaryaContainer] = None, ports: List[ZaryaPort] = None):
-        super().__init__(name, desc, can_leave, has_windows, items)
+                 items: List[ZaryaItem] = None, containers: List[ZaryaContainer] = None, station=None,
+                 room_id: int = None, key: str = None):
+        super().__init__(name, desc, can_leave, has_windows, items, key)
 
         self.has_windows = has_windows
-        if containers is None:
-            self.containers = []
-        else:
-            self.containers = containers
-        if ports is None:
-            self.ports = []
-        else:
-            self.ports = ports
+        self.containers = containers
+        self.station = station
+        self.room_id = room_id
 
     def __str__(self):
         return self.name
 
+    # containers are looked up by name, so keep a name index whenever they're assigned
+    @property
+    def containers(self) -> List[ZaryaContainer]:
+        return self._containers
+
+    @containers.setter
+    def containers(self, containers: List[ZaryaContainer]):
+        self._containers = [] if containers is None else containers
+        self._containers_by_name = {c.name: c for c in reversed(self._containers)}
+
+    @property
+    def ports(self) -> List[ZaryaPort]:
+        if self.station is None:
+            return []
+        return [ZaryaPort(self.station, i) for i in self.station.world.ports(self.room_id)]
+
+    def content_version(self):
+        if self.station is None:
+            return self.items.version, ()
+        return self.items.version, self.station.port_states(self.room_id)
+
+    def get_container(self, name: str):
+        """Get the container with the given name, or None."""
+        return self._containers_by_name.get(name)
+
+    def get_port(self, name: str):
+        """Get the port with the given name, or None."""
+        if self.station is None:
+            return None
+        index = self.station.find_port(self.room_id, name)
+        if index is None:
+            return None
+        return ZaryaPort(self.station, index)
+
+
+class ZaryaStation:
+    """One game's copy of a world, which only builds rooms from the world's template when they're first needed.
+
+    The layout of the station is shared with every other game on the same world, so a game only costs as much
+    as the rooms it has been to, however big the station is. Looking up a room's ports is O(its port count).
+
+    Attrs:
+        world -- the WorldTemplate the station is built from
+        rooms -- dict of the rooms built so far, keyed by room id
+        items -- dict of the items from the world file built so far, keyed by their world file key
+        port_overrides -- dict of port index to whether it's open, for ports that aren't as the world file has them
+    """
+    def __init__(self, world, build_room: Callable):
+        self.world = world
+        self.rooms = {}
+        self.items = {}
+        self.port_overrides = {}
+        # route trees from rooms with the ports as they are here, only used once any port has been overridden, least
+        # recently used first
+        self._routes = collections.OrderedDict()
+        # called with the station and a room id to build that room
+        self._build_room = build_room
+
+    def room(self, room_id: int) -> ZaryaRoom:
+        """Get a room, building it if it hasn't been yet."""
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = self._build_room(self, room_id)
+        return room
+
+    def room_by_key(self, key: str) -> ZaryaRoom:
+        return self.room(self.world.room_ids[key])
+
+    def is_port_open(self, index: int) -> bool:
+        is_open = self.port_overrides.get(index)
+        if is_open is None:
+            return bool(self.world.port_open[index])
+        return is_open
+
+    def set_port_open(self, index: int, is_open: bool):
+        """Open or close a port, and the port facing it from the room on the other side.
+
+        Raises:
+            ValueError -- the port doesn't lead anywhere, so it can't be opened
+        """
+        world = self.world
+        target = world.port_targets[index]
+        if target == NOWHERE:
+            raise ValueError(f'port {world.port_names[index]} leads nowhere')
+        changed = [index]
+        for back in world.ports(target):
+            if world.port_targets[back] == world.port_rooms[index]:
+                changed.append(back)
+                break
+        for port in changed:
+            if is_open == bool(world.port_open[port]):
+                self.port_overrides.pop(port, None)
+            else:
+                self.port_overrides[port] = is_open
+
+        if is_open:
+            # a newly open port can make any route shorter
+            self._routes.clear()
+        else:
+            # closing a port only changes the routes that went through it
+            for source, came_by in list(self._routes.items()):
+                if any(came_by[world.port_targets[port]] == port for port in changed):
+                    del self._routes[source]
+
+    def route(self, source: int, target: int):
+        """Get the indexes of the ports on a shortest route between two rooms through open ports, or None.
+
+        Routes are worked out with a search from the source room the first time they're needed. While no ports are
+        overridden the search is shared with every game on the same world, after that the station keeps its own, up to
+        STATION_ROUTE_CACHE_SIZE of them.
+        """
+        if not self.port_overrides:
+            return route_to(self.world, self.world.route_tree(source), target)
+        came_by = self._routes.get(source)
+        if came_by is None:
+            port_open = array('b', self.world.port_open)
+            for port, is_open in self.port_overrides.items():
+                port_open[port] = is_open
+            came_by = self._routes[source] = route_tree(self.world, source, port_open)
+            if len(self._routes) > STATION_ROUTE_CACHE_SIZE:
+                self._routes.popitem(last=False)
+        else:
+            self._routes.move_to_end(source)
+        return route_to(self.world, came_by, target)
+
+    def find_port(self, room_id: int, name: str):
+        """Get the index of a room's port with the given name, or None."""
+        port_names = self.world.port_names
+        for i in self.world.ports(room_id):
+            if port_names[i] == name:
+                return i
+        return None
+
+    def port_states(self, room_id: int) -> tuple:
+        """Get whether each of a room's ports is open."""
+        return tuple(self.is_port_open(i) for i in self.world.ports(room_id))
+
 
 class ZaryaPlayer:
     """Class for the player character.
 
     Attrs:
         name
-        inventory --  a list of ZaryaItem's
+        inventory -- a ZaryaItemSpace
         wearing -- outfit
         sleepiness -- how much sleep as a float
+        current_room -- the room or container the player is in
+        previous_room -- the room to go back to when leaving a container
+        profile -- the player's profiles.Profile
     """
-    name = STRS_GAME['player']['name_default']
+    __slots__ = ('name', 'inventory', 'wearing', 'sleepiness', 'current_room', 'previous_room', 'profile')
 
-    def __init__(self, name: str, inventory: List[ZaryaItem], wearing, sleepiness: float = 5):
+    def __init__(self, name: str, inventory: List[ZaryaItem], wearing, sleepiness: float = 5, room=None,
+                 profile: profiles.Profile = None):
+        self.profile = profiles.Profile() if profile is None else profile
         self.name = name
-        self.inventory = inventory
+        self.inventory = ZaryaItemSpace(inventory)
         self.wearing = wearing
         self.sleepiness = sleepiness
+        self.current_room = room
+        self.previous_room = room
 
     def __str__(self):
         return self.name
@@ -199,7 +512,7 @@ class ZaryaPlayer:
         if self.sleepiness > 8:
             await game_instance.stutter('You sleep until you are no longer tired.')
             game_instance.posix_time_ingame += self.sleepiness * 3600
-            self.sleepiness = random.randint(0, 2)
+            self.sleepiness = game_instance.random.randint(0, 2)
             await game_instance.stutter(
                 f"Date: {time.strftime('%d.%m.%Y', time.gmtime(game_instance.posix_time_ingame))}"
             )
@@ -207,27 +520,227 @@ class ZaryaPlayer:
             await game_instance.stutter('You are not tired enough to get to sleep.')
 
 
+def split_batch(command_input: str) -> List[str]:
+    """Split an input into the commands separated by BATCH_SEPARATOR, leaving out empty ones but always giving one."""
+    commands = [command.strip() for command in command_input.split(BATCH_SEPARATOR)]
+    return [command for command in commands if command] or ['']
+
+
+def compile_exact_commands(commands):
+    """Flatten a dict of alias tuples to handlers into a dict of each alias to its handler."""
+    return {alias: handler for aliases, handler in commands.items() for alias in aliases}
+
+
+def compile_verb_commands(commands):
+    """Compile a dict of verb tuples to handlers into a dict of first words to (verb words, handler) pairs.
+
+    The pairs for each first word are sorted longest verb first, so 'go through' is tried before 'go'.
+    """
+    compiled = {}
+    for verbs, handler in commands.items():
+        for verb in verbs:
+            verb_words = tuple(verb.split())
+            compiled.setdefault(verb_words[0], []).append((verb_words, handler))
+    return {
+        first_word: tuple(sorted(pairs, key=lambda pair: len(pair[0]), reverse=True))
+        for first_word, pairs in compiled.items()
+    }
+
+
+class StationBuilder:
+    """Builds the rooms of a station as games get to them, with names and descriptions from a string catalog.
+
+    Attrs:
+        strings -- StringCatalog the names and descriptions come from
+        item_classes -- dict of item types in world files to the classes they're made with
+    """
+    def __init__(self, strings, item_classes: dict):
+        self.strings = strings
+        self.item_classes = item_classes
+
+    def world_text(self, spec) -> tuple:
+        """Get the name and desc of a thing in the world file, from the strings file unless they're given inline."""
+        if spec.strings is None:
+            return spec.name, spec.desc
+        return self.strings[f'game.{spec.strings}.name'], self.strings[f'game.{spec.strings}.desc']
+
+    def build_room(self, station: ZaryaStation, room_id: int) -> ZaryaRoom:
+        """Build one room of a station, with its containers and items."""
+        world = station.world
+        spec = world.rooms[room_id]
+        containers = []
+        for container_id in spec.containers:
+            container_spec = world.containers[container_id]
+            containers.append(ZaryaContainer(
+                *self.world_text(container_spec), can_leave=True,
+                items=self.create_items(station, container_spec.items), key=container_spec.key
+            ))
+
+        return ZaryaRoom(
+            *self.world_text(spec), can_leave=False, has_windows=spec.has_windows,
+            items=self.create_items(station, spec.items), containers=containers, station=station, room_id=room_id,
+            key=spec.key
+        )
+
+    def create_items(self, station: ZaryaStation, item_ids) -> List[ZaryaItem]:
+        items = [self.create_item(station.world.items[i]) for i in item_ids]
+        for item in items:
+            station.items[item.key] = item
+        return items
+
+    def create_item(self, spec) -> ZaryaItem:
+        name, desc = self.world_text(spec)
+        item = self.item_classes[spec.type](
+            name=name, desc=desc, can_use=spec.use is not None, can_take=spec.can_take,
+            usefunc=None if spec.use is None else getattr(ZaryaGame, spec.use), key=spec.key
+        )
+        if spec.files is not None:
+            item.files = dict(spec.files)
+        return item
+
+
 class ZaryaGame:
-    def __init__(self, discord_client, send_channel, req_channel_name=None):
+    # item types in world files to the classes they're made with
+    item_classes = {'item': ZaryaItem, 'laptop': Laptop}
+
+    def __init__(self, discord_client, send_channel, req_channel_name=None, browser=None, persistent=True,
+                 lang=None, world=DEFAULT_WORLD, seed: int = None, parent=None, global_station=None,
+                 owner_id: int = None):
         self.discord_client = discord_client
+        # discord id of the user a single player game is played as, whose profile it loads and saves
+        self.owner_id = owner_id
+        guild = getattr(send_channel, 'guild', None)
+        self.guild_id = 0 if guild is None else guild.id
+        self.strings = get_catalog(lang or LANG)
+        # the GlobalStation this game plays on along with every other game on it, or None for its own station
+        self.global_station = global_station
+        if global_station is None:
+            self.world = get_world(world, USE_HANDLERS, get_catalog(LANG))
+            self.builder = StationBuilder(self.strings, self.item_classes)
+        else:
+            self.world = global_station.station.world
+            self.builder = global_station.builder
         self.send_channel = send_channel
+        # whether to save snapshots of this game so it can be resumed, games played on the laptop aren't
+        self.persistent = persistent
+        self.resumed = False
+        if browser is None:
+            self.browser = laptop_browser
+        else:
+            self.browser = browser
         if req_channel_name is None:
             self.req_channel_name = ''
         else:
             self.req_channel_name = req_channel_name
 
+        # a game played inside another one, like on the laptop, takes its input and randomness from the outer game
+        # and sends its output and logs through it, so the session stays one record that can be replayed
+        self.parent = parent
+        if parent is None:
+            self.input_queue = message_router.register(send_channel.id)
+            self.logger = game_log.session_logger(send_channel.id)
+            # everything random in the game comes from its own generator, so a session can be replayed from its seed
+            self.seed = random.getrandbits(32) if seed is None else seed
+            self.random = random.Random(self.seed)
+        else:
+            self.input_queue = parent.input_queue
+            self.logger = parent.logger
+            self.seed = parent.seed
+            self.random = parent.random
+        # the rest of a batch of commands, which are given to input() before anything else from the channel
+        self.pending_input = collections.deque()
+        # output from the batch being done, sent as one message when it's done, None when not doing a batch
+        self.output_buffer = None
+
+        self.create_world()
+
         self.carry = {'on': True}
         self.skip = False
         # 12 sep 2000
         self.posix_time_ingame = 968716800
 
+    def text(self, key, **kwargs):
+        """Get a string from this game's locale, under the 'game' key of the strings file, with its fields filled in."""
+        return self.strings.format(f'game.{key}', **kwargs)
+
+    async def input(self, batch: bool = False):
+        """Get the next command of the batch being done, or wait for the next input sent to this game's channel.
+
+        With batch, for the main loop, an input with several commands separated by BATCH_SEPARATOR starts a batch:
+        the first command is returned, and the rest are returned by the next calls, whether they're for the main loop
+        or a prompt like the laptop's. Output is buffered while a batch is being done, and sent as one message before
+        waiting for more input. Without it, for a prompt, an input is returned whole, so a URL with a ; in it is kept.
+
+        Every input from the channel is logged, for replaying the session.
+
+        Raises:
+            SessionEvicted -- the game was evicted while it was idle
+        """
+        if self.parent is not None:
+            return await self.parent.input(batch)
+        if self.pending_input:
+            return self.pending_input.popleft()
+        await self.flush_output()
+
+        command_input = (await self.read_input()).content
+        self.log(f'{game_log.INPUT_PREFIX}{command_input}')
+        if not batch or BATCH_SEPARATOR not in command_input:
+            return command_input
+
+        commands = split_batch(command_input)
+        if len(commands) > 1:
+            self.output_buffer = []
+            self.pending_input.extend(commands[1:])
+        return commands[0]
+
+    async def read_input(self) -> GameInput:
+        """Wait for the next input sent to this game's channel.
+
+        Raises:
+            SessionEvicted -- the game was evicted while it was idle
+        """
+        # the player has to see what the command waiting for them has held back
+        await send_held_output(self.send_channel, release=False)
+        started = tracer.await_started()
+        game_input = await self.input_queue.get()
+        tracer.await_ended(started, tracer.WAITING)
+        if isinstance(game_input, SessionEvicted):
+            raise game_input
+        return game_input
+
+    async def send_output(self, text, delay=None, skip=False):
+        """Send some output to the channel, or add it to the output buffer if a batch is being done."""
+        if self.parent is not None:
+            await self.parent.stutter(text, delay=delay, skip=skip)
+        elif self.output_buffer is not None:
+            if text:
+                self.output_buffer.append(text)
+        elif delay is None:
+            await discord_stutter(text, channel=self.send_channel, skip=skip)
+        else:
+            await discord_stutter(text, channel=self.send_channel, delay=delay, skip=skip)
+
+    async def flush_output(self):
+        """Send the output buffered while doing a batch as one message, split if it's too long for discord."""
+        if self.output_buffer is None:
+            return
+        text = '\n'.join(self.output_buffer)
+        self.output_buffer = None
+        if text:
+            await discord_stutter(text, channel=self.send_channel, skip=True)
+
+    def evict(self, evicted: SessionEvicted):
+        """Stop routing input to this game and make it end the next time it waits for input."""
+        message_router.unregister(self.send_channel.id, self.input_queue)
+        self.input_queue.put_nowait(evicted)
+
     # newline function from old version - redundant now
     async def n(self):
-        await discord_stutter('', channel=self.send_channel, skip=True)
+        await self.send_output('', skip=True)
 
     # typing output effects
     async def stutter(self, text, delay=lambda: random.randint(1, 3) / 100, skip=False):
-        await discord_stutter(text, channel=self.send_channel, delay=delay, skip=skip)
+        await self.send_output(text, delay=delay, skip=skip)
 
     async def stutters(self, text, skip=False):
         await self.stutter(text, delay=lambda: random.randint(5, 10) / 100, skip=skip)
@@ -248,9 +761,8 @@ class ZaryaGame:
 
     async def use_drive(self):
         for itemspace in self.player.inventory, self.current_room.items:
-            laptop_in_itemspace = [i for i in itemspace if isinstance(i, Laptop)]
-            if laptop_in_itemspace:
-                laptop = laptop_in_itemspace[0]
+            laptop = itemspace.first_of_type(Laptop)
+            if laptop is not None:
                 if self.drive.files:
                     await self.stutter('You transfer all the files on the usb stick to the laptop.')
                     laptop.files = self.drive.files
@@ -274,12 +786,13 @@ class ZaryaGame:
     async def use_camera(self):
         # TODO; more detailed pictures e.g. what the picture is of?
         if self.current_room.has_windows:
-            new_picture = Picture()
+            new_picture = Picture(self.random.randint(1, 10))
             await self.stutterl('You take the camera to a window and, after fiddling with '
                                 'lenses and settings for\na few minutes, take a ')
             await self.stutter(f'{new_picture.name}.')
 
             self.player.inventory.append(new_picture)
+            self.player.profile.pictures_taken += 1
         else:
             await self.stutter('There are no windows to take pictures out of in this module.')
 
@@ -309,8 +822,7 @@ class ZaryaGame:
         self.laptop.powered_on = True
         while self.laptop.powered_on:
             await self.n()
-            task = await discord_input(self.discord_client, self.req_channel_name)
-            self.log(task)
+            task = await self.input()
             await self.n()
 
             if task in ('turn off laptop', 'turn off', 'off', 'close laptop', 'close', 'quit'):
@@ -329,21 +841,20 @@ class ZaryaGame:
             # todo: puzzle for connecting to the internet?
             elif task in ['browse the web', 'browse web', 'browse', 'web', 'browser', 'web browser']:
                 await self.stutter('A browser window opens. Where do you want to go?')
-                url = await discord_input(self.discord_client, self.req_channel_name)
-                self.log(url)
+                url = await self.input()
                 try:
                     if not url.startswith('http'):
                         url = 'http://' + url
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url) as response:
-                            html = await response.text()
+                    html = await self.browser.fetch(url)
                     await self.stutter(html, skip=True)
                     await self.stutter("Hmm, looks like there's no GUI. \n"
                                        'Oh well.')
                 except ValueError:
                     await self.stutter("That's not a valid URL.")
-                except aiohttp.ClientConnectorError:
+                except aiohttp.ClientError:
                     await self.stutter("The site had an error.")
+                except asyncio.TimeoutError:
+                    await self.stutter('The site took too long to load.')
 
             elif task in ['read files', 'read', 'files']:
                 if not self.laptop.files:
@@ -359,25 +870,24 @@ class ZaryaGame:
                     await self.stutterf(contact)
 
                 await self.stutter('Who would you like to message?')
-                contact = await discord_input(self.discord_client, self.req_channel_name)
-                self.log(contact)
+                contact = await self.input()
                 if contact in contacts:
                     if contact in 'nasa social media team':
-                        pictures_in_inv = [p for p in self.player.inventory if isinstance(p, Picture)]
+                        pictures_in_inv = self.player.inventory.of_type(Picture)
                         pictures_list = ' \n'.join([p.name for p in pictures_in_inv])
 
                         await self.stutter('You can send pictures to NASA to be posted online. \n'
                                            'What picture would you like to send? \n'
                                            f"{pictures_list}")
-                        picture_to_send = await discord_input(self.discord_client, self.req_channel_name)
-                        self.log(picture_to_send)
+                        picture_to_send = await self.input()
 
                         if 'picture' in picture_to_send:
-                            if picture_to_send in [p.name for p in pictures_in_inv]:
+                            picture = self.player.inventory.get(picture_to_send)
+                            if isinstance(picture, Picture):
                                 await self.stutter('You send the picture.')
-                                picture = [p for p in pictures_in_inv if p.name == picture_to_send][0]
-                                likes = (picture.quality ** 2) * random.randint(10, 1000)
+                                likes = (picture.quality ** 2) * self.random.randint(10, 1000)
                                 await self.stutter(f'Your picture gets {likes} likes.')
+                                self.player.profile.likes += likes
                                 await self.stutter('You delete the picture to free up valuable storage space.')
                                 self.player.inventory.remove(picture)
                             else:
@@ -389,7 +899,10 @@ class ZaryaGame:
 
             # todo: fix moving between rooms, again
             elif task in 'play text game':
-                await ZaryaGame(self.discord_client, self.send_channel, self.req_channel_name).run()
+                await ZaryaGame(
+                    self.discord_client, self.send_channel, self.req_channel_name, self.browser, persistent=False,
+                    lang=self.strings.lang, parent=self
+                ).run()
 
             elif task in 'control station module':
                 await self.stutter('A window opens with a few readouts and options.\n'
@@ -401,12 +914,10 @@ class ZaryaGame:
                                    'alignment: retrograde\n'
                                    "There is a button that says 'fire main engines'.\n"
                                    'Would you like to press it? (yes/no)')
-                choice = await discord_input(self.discord_client, self.req_channel_name)
-                self.log(choice)
+                choice = await self.input()
                 if choice == 'yes':
                     await self.stutter('A dialog box pops up: ARE YOU SURE? (yes/no)')
-                    choice_confirm = await discord_input(self.discord_client, self.req_channel_name)
-                    self.log(choice_confirm)
+                    choice_confirm = await self.input()
                     if choice_confirm == 'yes':
                         await self.stutter('You press the button and tons of Gs force you against the back of the '
                                            'module. \n'
@@ -430,97 +941,186 @@ class ZaryaGame:
     # async def talktocrewmate():
     #     await self.stutter('Hello there! Glad to see you got that malfunctioning hatch open.')
 
-    # items
-    laptop = Laptop(
-        name=STRS_ITEMS['laptop']['name'], desc=STRS_ITEMS['laptop']['desc'],
-        can_use=True, can_take=True, usefunc=use_laptop
-    )
+    def create_world(self):
+        """Start this game's copy of the station, from its world's template, or join the global station.
 
-    paper = ZaryaItem(
-        name=STRS_ITEMS['paper']['name'], desc=STRS_ITEMS['paper']['desc'],
-        can_use=True, can_take=True, usefunc=use_paper
-    )
-
-    drive = ZaryaItem(
-        name=STRS_ITEMS['drive']['name'], desc=STRS_ITEMS['drive']['desc'],
-        can_use=True, can_take=True, usefunc=use_drive
-    )
-    drive.files = {'program.py': "'print('hello world!')'"}
-
-    jumpsuit = ZaryaItem(
-        name=STRS_ITEMS['jumpsuit']['name'], desc=STRS_ITEMS['jumpsuit']['desc'],
-        can_use=True, can_take=True, usefunc=use_jumpsuit
-    )
-
-    greenhouse = ZaryaItem(
-        name=STRS_ITEMS['greenhouse']['name'], desc=STRS_ITEMS['greenhouse']['desc'],
-        can_use=True, usefunc=use_greenhouse
-    )
-
-    camera = ZaryaItem(
-        name=STRS_ITEMS['camera']['name'], desc=STRS_ITEMS['camera']['desc'],
-        can_use=True, can_take=True, usefunc=use_camera
-    )
-
-    toilet = ZaryaItem(
-        name=STRS_ITEMS['toilet']['name'], desc=STRS_ITEMS['toilet']['desc'],
-        can_use=True, usefunc=use_toilet
-    )
+        Every game not on the global station gets its own items, containers, rooms and player, so games in
+        different channels don't share inventories or room contents. Names and descriptions are the shared strings
+        from the game's string catalog. Rooms are only built as the game gets to them, see ZaryaStation.
+        """
+        if self.global_station is None:
+            self.station = ZaryaStation(self.world, self.builder.build_room)
+        else:
+            self.station = self.global_station.station
 
-    bed = ZaryaItem(
-        name=STRS_ITEMS['bed']['name'], desc=STRS_ITEMS['bed']['desc'],
-        can_use=True, usefunc=use_bed
-    )
+        self.player = self.new_player(self.strings['game.player.name_default'])
 
-    # containers
-    zarya_boxes_items = [paper, drive, jumpsuit]
-    zarya_boxes = ZaryaContainer(
-        name=STRS_GAME['containers']['zarya_boxes']['name'],
-        desc=STRS_GAME['containers']['zarya_boxes']['desc'],
-        can_leave=True, items=zarya_boxes_items
-    )
+    def new_player(self, name: str) -> ZaryaPlayer:
+        """Make a player with nothing on them, in the world's start room."""
+        return ZaryaPlayer(
+            name=name, inventory=[], wearing=self.world.wearing, room=self.station.room(self.world.start_room)
+        )
 
-    # rooms
-    zarya = ZaryaRoom(
-        name=STRS_ROOMS['zarya']['name'], desc=STRS_ROOMS['zarya']['desc'],
-        can_leave=False, items=[laptop], containers=[zarya_boxes]
-    )
+    # where the player whose command is being done is, commands move them by setting these
+    @property
+    def current_room(self):
+        return self.player.current_room
+
+    @current_room.setter
+    def current_room(self, room):
+        self.player.current_room = room
+
+    @property
+    def previous_room(self):
+        return self.player.previous_room
+
+    @previous_room.setter
+    def previous_room(self, room):
+        self.player.previous_room = room
+
+    # items the use handlers need to find, None until the room they start in is built
+    @property
+    def laptop(self):
+        return self.station.items.get('laptop')
+
+    @property
+    def drive(self):
+        return self.station.items.get('drive')
+
+    def world_text(self, spec) -> tuple:
+        """Get the name and desc of a thing in the world file, in the language the station is built in."""
+        return self.builder.world_text(spec)
+
+    def places(self) -> dict:
+        """Get every room built so far and its containers, keyed by their world file keys."""
+        places = {}
+        for room in self.station.rooms.values():
+            places[room.key] = room
+            for container in room.containers:
+                places[f'{room.key}/{container.key}'] = container
+        return places
+
+    def item_spaces(self) -> dict:
+        """Get every item space in the world, keyed like places() with 'inventory' for the player's inventory."""
+        item_spaces = {key: place.items for key, place in self.places().items()}
+        item_spaces['inventory'] = self.player.inventory
+        return item_spaces
+
+    def world_objects(self) -> list:
+        """Get the objects that make up this game's world, for estimating its memory use."""
+        return [self.places(), self.player, self.station.items]
+
+    def snapshot(self) -> dict:
+        """Get the state of the game as plain values, for saving with the snapshots module.
+
+        Items are stored by their world file key, except pictures which are stored as their quality.
+        """
+        place_keys = {id(place): key for key, place in self.places().items()}
+        state = {
+            'items': {
+                key: [item.quality if isinstance(item, Picture) else item.key for item in itemspace]
+                for key, itemspace in self.item_spaces().items()
+            },
+            'tutorials_done': [
+                key for key, item in self.station.items.items() if getattr(item, 'tutorial_done', False)
+            ],
+            'files': {key: item.files for key, item in self.station.items.items() if hasattr(item, 'files')},
+            'port_overrides': list(self.station.port_overrides.items()),
+            'posix_time_ingame': self.posix_time_ingame,
+            'skip': self.skip,
+            'seed': self.seed,
+            'random_state': self.random.getstate(),
+            'owner_id': self.owner_id,
+        }
+        state.update(self.players_snapshot(place_keys))
+        return state
+
+    def players_snapshot(self, place_keys: dict) -> dict:
+        """Get the players' part of snapshot()."""
+        return self.player_snapshot(self.player, place_keys)
 
-    unity = ZaryaRoom(
-        name=STRS_ROOMS['unity']['name'], desc=STRS_ROOMS['unity']['desc'],
-        can_leave=False
-    )
+    @staticmethod
+    def player_snapshot(player: ZaryaPlayer, place_keys: dict) -> dict:
+        """Get a player's state for snapshot(), apart from their inventory which is with the other item spaces.
+
+        Args:
+            player
+            place_keys -- dict of the id of every place to its key from places()
+        """
+        return {
+            'room': place_keys[id(player.current_room)],
+            'previous_room': place_keys[id(player.previous_room)],
+            'player_name': player.name,
+            'wearing': player.wearing,
+            'sleepiness': player.sleepiness,
+        }
 
-    zvezda = ZaryaRoom(
-        name=STRS_ROOMS['zvezda']['name'], desc=STRS_ROOMS['zvezda']['desc'],
-        can_leave=False, has_windows=True, items=[greenhouse, camera, toilet, bed]
-    )
+    @staticmethod
+    def restore_player(player: ZaryaPlayer, state: dict, places: dict):
+        """Put a player into the state from player_snapshot()."""
+        player.current_room = places[state['room']]
+        player.previous_room = places[state['previous_room']]
+        player.name = state['player_name']
+        player.wearing = state['wearing']
+        player.sleepiness = state['sleepiness']
+
+    def restore(self, state: dict):
+        """Put a freshly created world into the state from snapshot()."""
+        # build every room the snapshot has, so all the items it refers to exist
+        for key in state['items']:
+            room_key = key.split('/')[0]
+            if room_key != 'inventory':
+                self.station.room_by_key(room_key)
+        item_spaces = self.item_spaces()
+        for itemspace in item_spaces.values():
+            for item in itemspace:
+                itemspace.remove(item)
+
+        for key, item_states in state['items'].items():
+            for item_state in item_states:
+                if isinstance(item_state, int):
+                    item_spaces[key].append(Picture(item_state))
+                else:
+                    item_spaces[key].append(self.station.items[item_state])
+
+        self.restore_players(state, self.places())
+        for key in state['tutorials_done']:
+            self.station.items[key].tutorial_done = True
+        for key, files in state['files'].items():
+            self.station.items[key].files = files
+        self.station.port_overrides = dict(state['port_overrides'])
+        # a game is carried on by whoever's next in the channel, but it's still its owner's, with their profile
+        self.owner_id = state.get('owner_id')
+        self.posix_time_ingame = state['posix_time_ingame']
+        self.skip = state['skip']
+        self.seed = state['seed']
+        version, internal_state, gauss_next = state['random_state']
+        self.random.setstate((version, tuple(internal_state), gauss_next))
+        self.resumed = True
+
+    def restore_players(self, state: dict, places: dict):
+        """Put the players into the state from snapshot(), once their inventories and every place are restored."""
+        self.restore_player(self.player, state, places)
+
+    def replaced(self) -> bool:
+        """Whether another game has been started in this game's channel since this one was evicted.
+
+        The channel's snapshot is the new game's then, so this one mustn't save over it or delete it.
+        """
+        queue = message_router.queues.get(self.send_channel.id)
+        return queue is not None and queue is not self.input_queue
+
+    async def save_snapshot(self):
+        """Save a snapshot of the game from an executor, so the disk write doesn't block the event loop."""
+        if self.persistent and not self.replaced():
+            await asyncio.get_running_loop().run_in_executor(
+                None, snapshots.save, self.send_channel.id, self.snapshot()
+            )
 
-    # now all rooms are declared, assign cross-references
-    zarya.ports = [
-        ZaryaPort(name='front', is_open=True, room=unity),
-        ZaryaPort('nadir'),
-        ZaryaPort(name='aft', is_open=True, room=zvezda),
-    ]
-    unity.ports = [
-        ZaryaPort('front'),
-        ZaryaPort('nadir'),
-        ZaryaPort('port'),
-        ZaryaPort('zenith'),
-        ZaryaPort('starboard'),
-        ZaryaPort(name='aft', is_open=True, room=zarya),
-    ]
-    zvezda.ports = [
-        ZaryaPort(name='front', is_open=True, room=zarya),
-        ZaryaPort('nadir'),
-        ZaryaPort('zenith'),
-        ZaryaPort('aft'),
-    ]
-
-    # player
-    player = ZaryaPlayer(
-        name=STRS_GAME['player']['name_default'], inventory=[], wearing='jumpsuit'
-    )
+    def delete_snapshot(self):
+        """Delete the game's snapshot once it's over, so it isn't resumed."""
+        if self.persistent and not self.replaced():
+            snapshots.delete(self.send_channel.id)
 
     # def helpwindow():
     #     helpw = Tk()
@@ -531,271 +1131,514 @@ class ZaryaGame:
     #     for help_info_item in help_info:
     #         text.append(helpc.create_text(325, (i*20)+20, text=help_info_item))
 
-    current_room = zarya
-    previous_room = zarya
-
-    # list of commands for help
-    help_info = [
-        'help -Shows a list of commands',
-        'skip -Toggles stuttering off',
-        'noskip -Toggles stuttering on',
-        'setname -Changes your name. Legally binding',
-        'look around -Tells you what is in the room',
-        'show inventory -Tells you what is in your inventory',
-        'search [object] -Tells you what is in a container',
-        'take [item] -Puts an item in your inventory',
-        'take all -Puts all available items in your inventory',
-        'use [item] -Lets you exercise the functionality of an item',
-        'leave [place] -Lets you leave where you are',
-        'go through [direction] port -Travel into adjacent modules',
-        'drop [item] -Removes an item from your inventory',
-        'quit -Ends the game',
-        'Note:\n You can also use abbreviations for some commands.',
-    ]
     # TODO: get this from some module instead?
     months = (
         'January', 'February', 'March', 'April', 'May', 'June',
         'July', 'August', 'September', 'October', 'November', 'December'
     )
 
-    async def process_command(self, command_input):
-        if command_input in ['help', 'h', 'commands']:
-            help_info_block = '\n'.join(self.help_info)
-            await self.stutterf(help_info_block)
-            await self.stutter('For the uninitiated: \n'
-                               'In text-based adventure games, a good first command when '
-                               "starting out or \nentering a new place is 'look around'.")
-
-        elif command_input in ['info', 'background', 'b']:
-            await self.stutterf(
-                f'Zarya-Discord v{__version__} \n'
-                f'{COPYRIGHT} \n'
-                "Remember to report any bugs or errors to 'JMcB#7918' - @ or DM me."
-            )
-            await self.stutter(
-                'I made this game as one of my first reasonably large projects about four years ago '
-                '(2016). It was very poorly coded but I worked quite a while on it, although after I '
-                "finished most of the framework stuff I couldn't be bothered to add much more content. "
-                "The writing, what there is, is ok, it's got some funny bits I guess. It's also very "
-                'well researched, everything in the game is on the ISS in real life - including Zarya. '
-                'Anyway, I had the idea recently (2021) to make a text based adventure game for Discord, '
-                'so I went back to my old project, touched the code up a bit, ported it, and here we are.'
-            )
+    # command handlers, each takes the argument left after the command's verb, which may be empty
+    async def command_help(self, argument):
+        await self.stutterf(self.text('commands.help.info'))
+        await self.stutter(self.text('commands.help.uninitiated'))
+
+    async def command_info(self, argument):
+        await self.stutterf(self.strings.format_static(
+            'game.commands.info.header', version=__version__, copyright=COPYRIGHT, discord_name=DISCORD_NAME
+        ))
+        await self.stutter(self.text('commands.info.story'))
+
+    # ignore bot-level commands
+    async def command_ignore(self, argument):
+        pass
+
+    async def command_quit(self, argument):
+        self.carry['on'] = False
+
+    def render_look(self) -> list:
+        """Get the messages for looking around the current room, cached on the room until its contents change."""
+        room = self.current_room
+        cache_key = (self.strings.lang, room.content_version())
+        if room.look_cache is not None and room.look_cache[0] == cache_key:
+            return room.look_cache[1]
+
+        # todo: more detailed info on windows
+        # todo: tell user where the ports lead?
+        if isinstance(room, ZaryaRoom):
+            desc_stem = self.text('rooms.desc_stem')
+        else:
+            desc_stem = self.text('containers.desc_stem')
+        messages = [self.text('commands.look.desc', stem=desc_stem, desc=room.desc)]
+        if room.has_windows:
+            messages.append(self.text('commands.look.windows'))
+
+        if room.items:
+            item_desc_stem = self.text('items.desc_stem')
+            item_descs = [self.text('commands.look.desc', stem=item_desc_stem, desc=i.desc) for i in room.items]
+            messages.append(' \n'.join(item_descs))
+
+        # only check for ports if room (not container)
+        if isinstance(room, ZaryaRoom):
+            if room.ports:
+                ports_list = [self.text('commands.look.ports', count=len(room.ports))]
+                for port in room.ports:
+                    port_state = self.text('commands.look.port_open' if port.is_open else 'commands.look.port_closed')
+                    ports_list.append(self.text('commands.look.port', name=port.name, state=port_state))
+                messages.append(' \n'.join(ports_list))
+
+        room.look_cache = (cache_key, messages)
+        return messages
+
+    async def command_look(self, argument):
+        for message in self.render_look():
+            await self.stutter(message)
+
+    async def command_inventory(self, argument):
+        if not self.player.inventory:
+            await self.stutter(self.text('commands.inventory.empty'))
+        else:
+            await self.stutter(self.text('commands.inventory.header'))
+            for inventory_item in self.player.inventory:
+                await self.stutter(inventory_item.name)
+
+    async def command_buyburger(self, argument):
+        await self.stutter(self.text('commands.buyburger'))
+
+    async def command_search(self, container_to_search):
+        container = None
+        if isinstance(self.current_room, ZaryaRoom):
+            container = self.current_room.get_container(container_to_search)
+        if container is not None:
+            self.previous_room = self.current_room
+            await self.stutter(self.text('commands.search.success', container=container_to_search))
+            self.current_room = container
 
-        # ignore bot-level commands
-        elif command_input in ['logs', 'log', 'log.txt']:
-            pass
+            if self.current_room.items:
+                items_list = self.text('commands.search.contents', container=container_to_search) + '\n'
+                items_list += ' \n'.join([i.desc for i in self.current_room.items])
+                await self.stutter(items_list)
+            else:
+                await self.stutter(self.text('commands.search.empty'))
+        else:
+            await self.stutter(self.text('commands.search.missing'))
 
-        elif command_input in ['quit', 'q']:
-            self.carry['on'] = False
+    async def command_leave(self, argument):
+        if self.current_room.can_leave:
+            await self.stutter(self.text('commands.leave.success', container=self.current_room.name))
+            self.current_room = self.previous_room
+        else:
+            await self.stutter(self.text('commands.leave.fail', name=self.player.name))
 
-        elif command_input in ['look around', 'look', 'la', 'l']:
-            # todo: more detailed info on windows
-            # todo: tell user where the ports lead?
-            await self.stutter(f'{self.current_room.desc_stem.rstrip()} {self.current_room.desc}.')
-            if self.current_room.has_windows:
-                await self.stutter('There are windows.')
+    async def command_go(self, direction):
+        if not isinstance(self.current_room, ZaryaRoom):
+            await self.stutter(self.text('commands.go.in_container'))
+            return
 
-            if self.current_room.items:
-                item_descs = [f'{i.desc_stem.rstrip()} {i.desc}.' for i in self.current_room.items]
-                await self.stutter(' \n'.join(item_descs))
-
-            # only check for ports if room (not container)
-            if isinstance(self.current_room, ZaryaRoom):
-                if self.current_room.ports:
-                    ports_list = f'There are {len(self.current_room.ports)} ports:'
-                    for port in self.current_room.ports:
-                        port_state = 'open' if port.is_open else 'closed'
-                        ports_list += f' \nOne to {port.name} that is {port_state}.'
-
-                    await self.stutter(ports_list)
-
-        elif command_input in ['show inventory', 'inventory', 'si', 'i']:
-            if not self.player.inventory:
-                await self.stutter('Your inventory is empty.')
-            else:
-                await self.stutter('In your inventory is: ')
-                for inventory_item in self.player.inventory:
-                    await self.stutter(inventory_item.name)
-
-        elif command_input == 'buyburger':
-            await self.stutter('BURGER. 🍔 MMM...')
-
-        elif command_input.startswith('search'):
-            container_to_search = command_input.removeprefix('search').lstrip()
-            # could use any() here?
-            if container_to_search in [container.name for container in self.current_room.containers]:
-                self.previous_room = self.current_room
-                await self.stutter(f'You search the {container_to_search}.')
-                # todo: make this kind of functionality a method of the room and the player's inventory.
-                self.current_room = [c for c in self.current_room.containers if c.name == container_to_search][0]
-
-                if self.current_room.items:
-                    items_list = f'The {container_to_search} contain(s): \n'
-                    items_list += ' \n'.join([i.desc for i in self.current_room.items])
-                    await self.stutter(items_list)
-                else:
-                    await self.stutter("There aren't any items in here.")
-            else:
-                await self.stutter("That isn't in here.")
+        if direction.endswith('port'):
+            direction = direction.removesuffix('port').rstrip()
 
-        elif command_input in ('leave',) or command_input.startswith(('leave',)):
-            if self.current_room.can_leave:
-                await self.stutter(f'You leave the {self.current_room.name}.')
-                self.current_room = self.previous_room
+        target_port = self.current_room.get_port(direction)
+        if target_port is not None:
+            if target_port.is_open:
+                await self.stutter(self.text('commands.go.success', room=target_port.room.name))
+                self.current_room = target_port.room
             else:
-                await self.stutter(f"I'm sorry {self.player.name}, I'm afraid you can't do that.")
-
-        elif command_input.startswith(('go through', 'gt', 'go')):
-            if isinstance(self.current_room, ZaryaContainer) and not isinstance(self.current_room, ZaryaRoom):
-                await self.stutter("You're searching a container, use 'leave' to leave.")
+                await self.stutter(self.text('commands.go.closed'))
+        else:
+            await self.stutter(self.text('commands.go.missing'))
+
+    async def set_port_open(self, direction: str, is_open: bool):
+        """Open or close one of the current room's ports, for the open and close commands."""
+        if not isinstance(self.current_room, ZaryaRoom):
+            await self.stutter(self.text('commands.go.in_container'))
+            return
+
+        if direction.endswith('port'):
+            direction = direction.removesuffix('port').rstrip()
+
+        target_port = self.current_room.get_port(direction)
+        if target_port is None:
+            await self.stutter(self.text('commands.go.missing'))
+        elif target_port.is_open == is_open:
+            await self.stutter(self.text('commands.port.already_open' if is_open else 'commands.port.already_closed'))
+        else:
+            try:
+                self.station.set_port_open(target_port.index, is_open)
+            except ValueError:
+                await self.stutter(self.text('commands.port.nowhere'))
                 return
+            await self.stutter(self.text('commands.port.opened' if is_open else 'commands.port.closed', port=direction))
+
+    async def command_open(self, direction):
+        await self.set_port_open(direction, True)
+
+    async def command_close(self, direction):
+        await self.set_port_open(direction, False)
+
+    def room_ids_by_name(self) -> dict:
+        """Get the ids of this game's world's rooms keyed by their lowercase names in the station's locale."""
+        key = (self.world.name, self.builder.strings.lang)
+        room_ids = _room_ids_by_name.get(key)
+        if room_ids is None:
+            # the first room with a name wins if there are several
+            room_ids = _room_ids_by_name[key] = {
+                self.world_text(spec)[0].lower(): room_id
+                for room_id, spec in reversed(list(enumerate(self.world.rooms)))
+            }
+        return room_ids
+
+    async def command_travel(self, module):
+        if not isinstance(self.current_room, ZaryaRoom):
+            await self.stutter(self.text('commands.go.in_container'))
+            return
+
+        room_id = self.room_ids_by_name().get(module)
+        if room_id is None:
+            await self.stutter(self.text('commands.travel.unknown', room=module))
+            return
+        if room_id == self.current_room.room_id:
+            await self.stutter(self.text('commands.travel.here', room=self.current_room.name))
+            return
+
+        route = self.station.route(self.current_room.room_id, room_id)
+        room_name = self.world_text(self.world.rooms[room_id])[0]
+        if route is None:
+            await self.stutter(self.text('commands.travel.unreachable', room=room_name))
+            return
+
+        # the whole trip is one message, rooms on the way aren't built
+        world = self.world
+        hops = [
+            self.text(
+                'commands.travel.hop', port=world.port_names[port],
+                room=self.world_text(world.rooms[world.port_targets[port]])[0]
+            )
+            for port in route
+        ]
+        self.current_room = self.station.room(room_id)
+        await self.stutter(
+            self.text('commands.travel.success', room=room_name, route=' \n'.join(hops))
+        )
 
-            if command_input.endswith('port'):
-                direction = command_input.removesuffix('port').rstrip()
-            else:
-                direction = command_input
-
-            # note: less verbose commands must come later in the list or an incomplete prefix could be stripped.
-            for prefix in ['go through', 'gt', 'go']:
-                if direction.startswith(prefix):
-                    direction = direction.removeprefix(prefix).lstrip()
-                    break
-
-            if direction in [port.name for port in self.current_room.ports]:
-                target_port = [p for p in self.current_room.ports if p.name == direction][0]
-                if target_port.is_open:
-                    await self.stutter(f'You go through the port into {target_port.room.name}.')
-                    self.current_room = target_port.room
+    async def command_take_all(self, argument):
+        if self.current_room.items:
+            # TODO: ? add ascii art here lol
+            await self.stutter(self.text('commands.take.all'))
+
+            items_to_remove = []
+            for item in self.current_room.items:
+                if item.can_take:
+                    self.player.inventory.append(item)
+                    await self.stutter(self.text('commands.take.success', item=item.name))
+                    items_to_remove.append(item)
                 else:
-                    await self.stutter('That port is closed.')
-            else:
-                await self.stutter("The module you're in doesn't have a port there.")
-
-        elif command_input in ['take all', 'ta']:
-            if self.current_room.items:
-                # TODO: ? add ascii art here lol
-                await self.stutter('You: \n'
-                                   'TAKE \n'
-                                   'ALL THE THINGS.')
-
-                items_to_remove = []
-                for item in self.current_room.items:
-                    if item.can_take:
-                        self.player.inventory.append(item)
-                        await self.stutter(f'You take the {item.name}.')
-                        items_to_remove.append(item)
-                    else:
-                        await self.stutter(f"You can't take the {item.name}.")
-                for item in items_to_remove:
-                    self.current_room.items.remove(item)
-            else:
-                await self.stutter("There's nothing here.")
-
-        elif command_input.startswith(('take', 'pick up')):
-            for prefix in ('take', 'pick up'):
-                if command_input.startswith(prefix):
-                    item_to_take = command_input.removeprefix(prefix).lstrip()
-
-                    if item_to_take in [i.name for i in self.current_room.items]:
-                        item = [i for i in self.current_room.items if i.name == item_to_take][0]
-                        if item.can_take:
-                            await self.stutter(f'You take the {item.name}.')
-                            self.player.inventory.append(item)
-                            self.current_room.items.remove(item)
-                        else:
-                            await self.stutter("You can't take that.")
-                    else:
-                        await self.stutter("That item isn't here.")
-                    break
-
-        elif command_input.startswith('use'):
-            item_to_use = command_input.removeprefix('use').lstrip()
-
-            # TODO: reduce duplicated code (the bit with a listcomp)
-            for itemspace in (self.player.inventory, self.current_room.items):
-                if item_to_use in [i.name for i in itemspace]:
-                    item = [i for i in itemspace if i.name == item_to_use][0]
-                    if item.can_use:
-                        await item.usefunc(self)
-                    else:
-                        await self.stutter("That item isn't usable.")
-                    break
-            else:
-                await self.stutter("You don't have that item.")
-
-        elif command_input.startswith('drop'):
-            item_to_drop = command_input.removeprefix('drop').lstrip()
-            if item_to_drop in [item.name for item in self.player.inventory]:
-                item = [i for i in self.player.inventory if i.name == item_to_drop][0]
-                await self.stutter(f'You drop the {item.name}.')
-                self.current_room.items.append(item)
-                self.player.inventory.remove(item)
+                    await self.stutter(self.text('commands.take.cant_take_item', item=item.name))
+            for item in items_to_remove:
+                self.current_room.items.remove(item)
+        else:
+            await self.stutter(self.text('commands.take.nothing'))
+
+    async def command_take(self, item_to_take):
+        item = self.current_room.items.get(item_to_take)
+        if item is not None:
+            if item.can_take:
+                await self.stutter(self.text('commands.take.success', item=item.name))
+                self.player.inventory.append(item)
+                self.current_room.items.remove(item)
             else:
-                await self.stutter("That item isn't in your inventory.")
-
-        elif command_input in ['skip', 's']:
-            self.skip = True
-            await self.stutter('Text will now output instantly.')
+                await self.stutter(self.text('commands.take.cant_take'))
+        else:
+            await self.stutter(self.text('commands.take.missing'))
+
+    async def command_use(self, item_to_use):
+        for itemspace in (self.player.inventory, self.current_room.items):
+            item = itemspace.get(item_to_use)
+            if item is not None:
+                if item.can_use:
+                    trace = tracer.current.get()
+                    if trace is not None:
+                        trace.handler = item.usefunc.__name__
+                    await item.usefunc(self)
+                else:
+                    await self.stutter(self.text('commands.use.unusable'))
+                break
+        else:
+            await self.stutter(self.text('commands.use.missing'))
+
+    async def command_drop(self, item_to_drop):
+        item = self.player.inventory.get(item_to_drop)
+        if item is not None:
+            await self.stutter(self.text('commands.drop.success', item=item.name))
+            self.current_room.items.append(item)
+            self.player.inventory.remove(item)
+            if self.global_station is not None:
+                self.global_station.tidy(self.current_room)
+        else:
+            await self.stutter(self.text('commands.drop.missing'))
 
-        elif command_input in ['noskip', 'ns', 'n']:
-            self.skip = False
-            await self.stutter('Text will now output gradually.')
+    async def command_skip(self, argument):
+        self.skip = True
+        await self.stutter(self.text('commands.skip'))
 
-        elif command_input.startswith(('name', 'setname', 'my name is')):
-            for command_invoc in ('name', 'setname', 'my name is'):
-                if command_input.startswith(command_invoc):
-                    new_name = command_input.removeprefix(command_invoc).lstrip()
-                    self.player.name = new_name
-                    await self.stutter(f'Your name is {self.player.name}.')
+    async def command_noskip(self, argument):
+        self.skip = False
+        await self.stutter(self.text('commands.noskip'))
+
+    async def command_name(self, new_name):
+        self.player.name = new_name
+        await self.stutter(self.text('commands.name', name=self.player.name))
+
+    async def command_stats(self, argument):
+        profile = self.player.profile
+        await self.stutter(self.text(
+            'commands.stats', name=self.player.name, sessions=profile.sessions, commands=profile.commands,
+            pictures_taken=profile.pictures_taken, likes=profile.likes
+        ))
+
+    async def command_invalid(self, argument):
+        await self.stutter(self.text('commands.invalid'))
+
+    # commands that can wait for input, so their output can't be held back on the global station, and they're done
+    # with the place locked instead
+    unbuffered_commands = frozenset((command_use,))
+    # commands that must match the whole input
+    exact_commands = compile_exact_commands({
+        ('help', 'h', 'commands'): command_help,
+        ('info', 'background', 'b'): command_info,
+        ('logs', 'log', 'log.txt'): command_ignore,
+        ('quit', 'q'): command_quit,
+        ('look around', 'look', 'la', 'l'): command_look,
+        ('show inventory', 'inventory', 'si', 'i'): command_inventory,
+        ('buyburger',): command_buyburger,
+        ('take all', 'ta'): command_take_all,
+        ('skip', 's'): command_skip,
+        ('stats', 'my stats'): command_stats,
+        ('noskip', 'ns', 'n'): command_noskip,
+    })
+    # commands made of a verb, which may be several words, followed by an argument
+    verb_commands = compile_verb_commands({
+        ('search',): command_search,
+        ('leave',): command_leave,
+        ('go through', 'gt', 'go'): command_go,
+        ('travel to', 'travel', 'tt'): command_travel,
+        ('open',): command_open,
+        ('close',): command_close,
+        ('take', 'pick up'): command_take,
+        ('use',): command_use,
+        ('drop',): command_drop,
+        ('name', 'setname', 'my name is'): command_name,
+    })
+
+    @classmethod
+    def parse_command(cls, command_input):
+        """Find the handler for a command.
+
+        Exact commands are a single dict lookup. Otherwise, the first word is looked up to get the few verbs starting
+        with it, and verbs only match on whole words, so 'user' isn't taken for 'use'.
+        Returns:
+            The handler function and the argument to call it with.
+        """
+        handler = cls.exact_commands.get(command_input)
+        if handler is not None:
+            return handler, ''
+
+        words = command_input.split()
+        if words:
+            for verb, handler in cls.verb_commands.get(words[0], ()):
+                if tuple(words[:len(verb)]) == verb:
+                    return handler, ' '.join(words[len(verb):])
+
+        return cls.command_invalid, command_input
+
+    async def wait_for_place(self):
+        """Tell the player another game is using something where they are, on the global station."""
+        await self.stutter(self.text('commands.use.busy'))
 
-        else:
-            await self.stutter("That's not a valid command.")
+    async def process_command(self, command_input):
+        handler, argument = self.parse_command(command_input)
+        trace = None
+        if tracer.enabled:
+            trace = tracer.begin(self.logger.extra['session'], self.send_channel.id, command_input, handler.__name__)
+        start = time.perf_counter()
+        # a command's stutters are sent as one message, unless its output is already being buffered
+        hold = self.parent is None and self.output_buffer is None
+        if hold:
+            hold_output(self.send_channel)
+        try:
+            if self.global_station is None:
+                await handler(self, argument)
+            elif handler in self.unbuffered_commands:
+                # these yield to other games part way through, like use drive between reading and moving the files,
+                # so other games wait to do them in the same place
+                async with self.global_station.locked(self.current_room, self.wait_for_place):
+                    await handler(self, argument)
+            else:
+                # other games share the global station, and holding the output back until the command is done means
+                # it never yields to them part way through, so it's atomic without any locking
+                flush = self.output_buffer is None
+                if flush:
+                    self.output_buffer = []
+                await handler(self, argument)
+                if flush:
+                    await self.flush_output()
+        finally:
+            if hold:
+                await send_held_output(self.send_channel)
+            if trace is not None:
+                tracer.end(trace)
+        metrics.observe_command(handler.__name__, time.perf_counter() - start)
 
     async def run(self):
-        await self.stutterf(
-            f'Zarya-Discord v{__version__} \n'
-            f'{COPYRIGHT} \n'
-            f"Remember to report any bugs or errors to '{DISCORD_NAME}' - @ or DM me. \n"
-        )
+        await self.stutterf(self.strings.format_static(
+            'game.run.header', version=__version__, copyright=COPYRIGHT, discord_name=DISCORD_NAME
+        ))
         await self.n()
-        await self.stutter(
-            f"Date: {time.strftime('%d.%m.%Y', time.gmtime(self.posix_time_ingame))} \n"
-            "For a list of commands, type 'help'."
-        )
+        if self.resumed:
+            await self.stutter(self.text('run.restored'))
+        await self.stutter(self.text(
+            'run.date', date=time.strftime('%d.%m.%Y', time.gmtime(self.posix_time_ingame))
+        ))
+
+        if self.owner_id is not None and not self.join_profile(self.player, self.owner_id):
+            await self.stutter(self.text('run.already_playing'))
+            return
+        try:
+            await self.main_loop()
+        except SessionEvicted as evicted:
+            if self.parent is not None:
+                raise
+            self.log('evicted')
+            if evicted.keep_snapshot and self.persistent:
+                await self.save_snapshot()
+                await self.stutter(self.text('run.evicted_paused'))
+            else:
+                self.delete_snapshot()
+                await self.stutter(self.text('run.evicted_ended'))
+            return
+        finally:
+            if self.global_station is not None:
+                self.leave_station()
+            self.leave_profiles()
+
+        self.delete_snapshot()
+        await self.stutter(self.text('run.thanks'))
+        # quitting in the middle of a batch leaves its output buffered
+        await self.flush_output()
 
-        while self.carry['on']:
-            self.player.sleepiness += 1
-            # one hour
-            self.posix_time_ingame += 60 ** 3
-            # could check at like 8 as well but don't want to bother the player, it's not an educational game
-            if self.player.sleepiness == 24:
-                await self.stutter("You haven't slept for a while. You're starting to feel very sleepy.")
-            elif self.player.sleepiness == 40:
-                await self.stutter("You haven't slept in too long. "
-                                   "You're very, very tired and you're going to black out soon.")
-            elif self.player.sleepiness == 48:
-                await self.stutter("You start to nod off. Before you fall asleep you realise you haven't slept in "
-                                   'about two days.')
-                await self.player.sleep(self)
-                await self.stutter('You wake up floating around. You should have slept in your bed sooner.')
+    @staticmethod
+    def drop_inventory(player: ZaryaPlayer):
+        """Leave what a player has picked up in the place they're in, for a player leaving a shared station.
+
+        Pictures are the player's own, so they keep them.
+        """
+        for item in list(player.inventory):
+            if not isinstance(item, Picture):
+                player.inventory.remove(item)
+                player.current_room.items.append(item)
+
+    def join_profile(self, player: ZaryaPlayer, user_id: int) -> bool:
+        """Give a player the profile of the user playing them, from the profile store if they've played before.
+
+        A player with a stored profile gets back the name, outfit and pictures they had, unless the game was resumed
+        from a snapshot, which already has them as they were.
+        Returns:
+            False if the user is being played in another game, then the player keeps a profile that isn't saved.
+        """
+        if profiles.store is not None and not profiles.store.claim(self.guild_id, user_id):
+            return False
+        stored = self.stored_player(user_id)
+        if stored is None:
+            player.profile = profiles.Profile(self.guild_id, user_id)
+        else:
+            player.profile = stored.profile()
+            if not self.resumed:
+                # what's loaded is logged, so the session can be replayed without the store
+                self.log(f'{game_log.PROFILE_PREFIX}{user_id} {json.dumps(stored[2:], ensure_ascii=False)}')
+                player.name = stored.name
+                player.wearing = stored.wearing
+                for quality in stored.pictures:
+                    player.inventory.append(Picture(quality))
+        player.profile.sessions += 1
+        return True
+
+    def stored_player(self, user_id: int):
+        """Get a user's player from the profile store, or None if it isn't open or they haven't played here before."""
+        if profiles.store is None:
+            return None
+        return profiles.store.load(self.guild_id, user_id)
 
+    @staticmethod
+    def save_profile(player: ZaryaPlayer):
+        """Save a player to the profile store, if it's open and they're someone's player."""
+        profile = player.profile
+        if profiles.store is None or profile.user_id is None:
+            return
+        pictures = tuple(picture.quality for picture in player.inventory.of_type(Picture))
+        profiles.store.save(profiles.StoredPlayer(
+            profile.guild_id, profile.user_id, player.name, player.wearing, profile.sessions, profile.commands,
+            profile.pictures_taken, profile.likes, pictures
+        ))
+
+    @classmethod
+    def leave_profile(cls, player: ZaryaPlayer):
+        """Save a player to the profile store for the last time this game, and release them for other games."""
+        cls.save_profile(player)
+        if profiles.store is not None and player.profile.user_id is not None:
+            profiles.store.release(player.profile.guild_id, player.profile.user_id)
+
+    def leave_profiles(self):
+        """Save and release every player in the game, when it ends."""
+        self.leave_profile(self.player)
+
+    def leave_station(self):
+        """Leave what the player has on the global station for the games still on it, when this game ends."""
+        self.drop_inventory(self.player)
+
+    async def pass_time(self):
+        """Move the time on before a command, making the player sleepier."""
+        self.player.sleepiness += 1
+        # one hour
+        self.posix_time_ingame += 60 ** 3
+        # could check at like 8 as well but don't want to bother the player, it's not an educational game
+        if self.player.sleepiness == 24:
+            await self.stutter(self.text('run.sleepy'))
+        elif self.player.sleepiness == 40:
+            await self.stutter(self.text('run.very_sleepy'))
+        elif self.player.sleepiness == 48:
+            await self.stutter(self.text('run.nod_off'))
+            await self.player.sleep(self)
+            await self.stutter(self.text('run.wake_up'))
+
+    async def main_loop(self):
+        while self.carry['on']:
+            await self.pass_time()
             await self.n()
-            command_input = await discord_input(self.discord_client, self.req_channel_name)
+            command_input = await self.input(batch=True)
             command_input = command_input.lower()
-            self.log(command_input)
             await self.n()
             await self.process_command(command_input)
-
-        await self.stutter('Thanks for playing!')
+            self.player.profile.commands += 1
+            # a batch is saved once it's all done
+            if not self.pending_input:
+                self.save_profile(self.player)
+                await self.save_snapshot()
 
     # logging
-    @staticmethod
-    def log(text):
-        with open('log.txt', 'a+') as log_file:
-            log_file.write('\n' + str(text))
+    def log(self, text):
+        self.logger.info(text)
 
     def log_start(self):
-        self.log('\n')
-        self.log('hello world!')
-        self.log(time.strftime('%Y-%m-%d %H:%M:%S'))
+        details = {}
+        if self.owner_id is not None:
+            details['owner'] = self.owner_id
+        self.log(game_log.start_message(
+            self.req_channel_name, seed=self.seed, lang=self.strings.lang, world=self.world.name,
+            resumed=int(self.resumed), **details
+        ))
+
+
+# (world name, locale) to the world's room ids keyed by lowercase room name, made the first time they're needed
+_room_ids_by_name = {}
+
+# names of the item use handlers world files can refer to
+USE_HANDLERS = tuple(name for name in dir(ZaryaGame) if name.startswith('use_'))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import asyncio
+import argparse
+
+from game import game_log
+from game.profiles import StoredPlayer
+from game.headless import HeadlessGame, HeadlessMultiplayerGame, HeadlessChannel, HeadlessAuthor
+from game.world import DEFAULT_WORLD
+
+
+__version__ = '0.1.0'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a logged Zarya session headlessly, from its seed and inputs.')
+    parser.add_argument('session', help='session id, the second part of the [channel:session] tag in the log')
+    parser.add_argument('--log', default=game_log.LOG_FILE, help='log file the session is in, backups are read too')
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't print the game's output")
+    args = parser.parse_args()
+
+    print(f'Zarya replay v{__version__}')
+    try:
+        session = game_log.read_session(args.session, args.log)
+    except LookupError as e:
+        print(f'{e}.')
+        sys.exit(1)
+    if 'seed' not in session.details:
+        print(f'Session {args.session} was logged without a seed, so it can\'t be replayed.')
+        sys.exit(1)
+    if session.details.get('resumed') == '1':
+        print('Session was resumed from a snapshot, the replay starts from a new game instead.')
+
+    script = session.inputs
+    game_class = HeadlessGame
+    if session.details.get('multiplayer') == '1':
+        # multiplayer inputs are logged after the id of the player who sent them, the replay names players by id
+        authors = {}
+        script = []
+        for line in session.inputs:
+            author_id, _, text = line.partition(' ')
+            script.append((authors.setdefault(author_id, HeadlessAuthor(int(author_id))), text))
+        game_class = HeadlessMultiplayerGame
+
+    # players are loaded from the profiles they were logged with, not whatever the store has for them by now
+    stored_players = {
+        user_id: StoredPlayer(0, user_id, *values[:-1], tuple(values[-1]))
+        for user_id, values in session.profiles.items()
+    }
+    owner = session.details.get('owner')
+    channel = HeadlessChannel(name=session.channel, keep_output=True)
+    game = game_class(
+        script, channel=channel, seed=int(session.details['seed']), lang=session.details.get('lang'),
+        world=session.details.get('world', DEFAULT_WORLD), owner_id=None if owner is None else int(owner),
+        stored_players=stored_players
+    )
+    start = time.perf_counter()
+    asyncio.run(game.run())
+    elapsed = time.perf_counter() - start
+
+    if not args.quiet:
+        print(channel.output())
+    print(f'Replayed {len(session.inputs)} inputs in {elapsed:.3f} seconds.')
+
+
+if __name__ == '__main__':
+    main()
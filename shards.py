@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from aiohttp import web
+
+
+__version__ = '0.1.0'
+
+
+STATS_DIR = 'stats'
+# seconds between checking on the shard processes
+POLL_INTERVAL = 1
+# seconds between printing combined stats
+REPORT_INTERVAL = 60
+# seconds to wait before restarting a crashed shard, doubled for each crash in a row up to the max
+RESTART_DELAY = 5
+RESTART_DELAY_MAX = 300
+# a shard that stays up this long is considered healthy again
+HEALTHY_UPTIME = 600
+# seconds --check waits for every shard to identify to the fake gateway
+CHECK_TIMEOUT = 60
+# the bot user the fake discord API logs shards in as
+FAKE_USER = {'id': '1', 'username': 'zarya', 'discriminator': '0000', 'avatar': None, 'bot': True}
+
+
+class Shard:
+    """A bot process running one shard.
+
+    Attrs:
+        shard_id
+        shard_count
+        process -- the running subprocess.Popen, or None while waiting to restart
+        restarts -- how many times the shard has been restarted
+        crashes_in_a_row -- exits without a healthy uptime in between, for the restart backoff
+        started_at -- time.monotonic() time the process was started at
+        restart_at -- time.monotonic() time to restart the shard at, if it isn't running
+        settings -- settings file the bot process uses
+    """
+    def __init__(self, shard_id: int, shard_count: int, settings: str = 'settings.json', quiet: bool = False):
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.settings = settings
+        self.quiet = quiet
+        self.process = None
+        self.restarts = 0
+        self.crashes_in_a_row = 0
+        self.started_at = 0
+        self.restart_at = 0
+
+    def start(self):
+        print(f'Starting shard {self.shard_id}.')
+        self.process = subprocess.Popen([
+            sys.executable, 'bot.py', '--shard-id', str(self.shard_id), '--shard-count', str(self.shard_count),
+            '--settings', self.settings,
+        ], stdout=subprocess.DEVNULL if self.quiet else None, stderr=subprocess.DEVNULL if self.quiet else None)
+        self.started_at = time.monotonic()
+
+    def poll(self):
+        """Restart the shard if its process has exited and its restart delay has passed."""
+        now = time.monotonic()
+        if self.process is None:
+            if now >= self.restart_at:
+                self.restarts += 1
+                self.start()
+            return
+
+        return_code = self.process.poll()
+        if return_code is None:
+            return
+
+        if now - self.started_at >= HEALTHY_UPTIME:
+            self.crashes_in_a_row = 0
+        delay = min(RESTART_DELAY * 2 ** self.crashes_in_a_row, RESTART_DELAY_MAX)
+        self.crashes_in_a_row += 1
+        print(f'Shard {self.shard_id} exited with code {return_code}, restarting in {delay} seconds.')
+        self.process = None
+        self.restart_at = now + delay
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is not None:
+            self.process.wait()
+
+
+def read_stats(shards) -> dict:
+    """Combine the stats files written by each shard."""
+    totals = {'shards_up': 0, 'restarts': 0, 'guilds': 0, 'live_sessions': 0, 'evictions': 0}
+    for shard in shards:
+        totals['restarts'] += shard.restarts
+        if shard.process is not None:
+            totals['shards_up'] += 1
+        try:
+            with open(os.path.join(STATS_DIR, f'shard-{shard.shard_id}.json')) as stats_file:
+                stats = json.load(stats_file)
+        except (OSError, ValueError):
+            continue
+        for key in ('guilds', 'live_sessions', 'evictions'):
+            totals[key] += stats.get(key, 0)
+    return totals
+
+
+class FakeDiscord:
+    """Just enough of discord's API and gateway on localhost for bot processes to log in and identify.
+
+    Attrs:
+        identified -- set of the shard of each IDENTIFY payload, as (shard id, shard count), or None without one
+        port -- port it's listening on, once started
+    """
+    def __init__(self):
+        self.identified = set()
+        self.changed = asyncio.Event()
+        self.runner = None
+        self.port = None
+
+    @property
+    def api_base(self) -> str:
+        return f'http://127.0.0.1:{self.port}/api/v7'
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/api/v7/users/@me', self.handle_user)
+        app.router.add_get('/api/v7/gateway', self.handle_gateway)
+        app.router.add_get('/gateway', self.handle_websocket)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    @staticmethod
+    def json_response(data) -> web.Response:
+        # discord.py only reads a response as json when its content type has no charset
+        return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+    async def handle_user(self, request: web.Request) -> web.Response:
+        return self.json_response(FAKE_USER)
+
+    async def handle_gateway(self, request: web.Request) -> web.Response:
+        return self.json_response({'url': f'ws://127.0.0.1:{self.port}/gateway'})
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """Say hello, note the shard the bot identifies as, then hang up."""
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        await websocket.send_json({'op': 10, 'd': {'heartbeat_interval': 45000}, 's': None, 't': None})
+        async for message in websocket:
+            payload = json.loads(message.data)
+            if payload.get('op') == 2:
+                shard = payload['d'].get('shard')
+                self.identified.add(None if shard is None else tuple(shard))
+                self.changed.set()
+                break
+        await websocket.close()
+        return websocket
+
+    async def wait_for(self, shards: set, timeout: float):
+        """Wait until every one of some shards has identified, or raise asyncio.TimeoutError."""
+        async def wait():
+            while not shards <= self.identified:
+                self.changed.clear()
+                await self.changed.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+
+async def check_gateway(shard_count: int) -> bool:
+    """Start every shard against a fake discord, and check each identifies as its own shard."""
+    fake = FakeDiscord()
+    await fake.start()
+    expected = {(shard_id, shard_count) for shard_id in range(shard_count)}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        settings_path = os.path.join(temp_dir, 'settings.json')
+        with open(settings_path, 'w') as settings_file:
+            json.dump({
+                'discord': {'token': 'fake', 'api_base': fake.api_base},
+                'logging': {'file': os.path.join(temp_dir, 'log.txt')},
+                'profiles': {'enabled': False},
+            }, settings_file)
+
+        shards = [Shard(shard_id, shard_count, settings=settings_path, quiet=True) for shard_id in range(shard_count)]
+        for shard in shards:
+            shard.start()
+        try:
+            await fake.wait_for(expected, CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for shard in shards:
+                shard.stop()
+            for shard in shards:
+                shard.wait()
+            await fake.stop()
+
+    for shard in sorted(expected - fake.identified):
+        print(f'Shard {shard[0]} never identified as shard {list(shard)}.')
+    for shard in fake.identified - expected:
+        print(f'A shard identified as {shard}.')
+    return fake.identified == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Zarya discord bot as one process per shard.')
+    parser.add_argument('shard_count', type=int, help='number of shards to run')
+    parser.add_argument('--settings', default='settings.json', help='settings file for the bot processes')
+    parser.add_argument(
+        '--check', action='store_true',
+        help="start the shards against a local fake discord gateway and check each identifies as its shard, "
+             "instead of running them"
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        ok = asyncio.get_event_loop().run_until_complete(check_gateway(args.shard_count))
+        print('Every shard identified as its own shard.' if ok else 'Shard check failed.')
+        sys.exit(0 if ok else 1)
+
+    print(f'Zarya shard supervisor v{__version__}')
+    shards = [Shard(shard_id, args.shard_count, settings=args.settings) for shard_id in range(args.shard_count)]
+    for shard in shards:
+        shard.start()
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            for shard in shards:
+                shard.poll()
+
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                last_report = time.monotonic()
+                print(' '.join(f'{key}={value}' for key, value in read_stats(shards).items()))
+    except KeyboardInterrupt:
+        print('Stopping shards.')
+        for shard in shards:
+            shard.stop()
+        for shard in shards:
+            shard.wait()
+
+
+if __name__ == '__main__':
+    main()